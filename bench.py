@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Set, Tuple
+import numpy as np
+from numpy.typing import NDArray
+from export import iter_ascii_stl, write_binary_stl, write_obj
+from mesh import weld
+from state import State
+
+DEFAULT_SCALES = [1e3, 1e4, 1e5]
+
+# benchmark name -> function taking face count and returning the timed
+# callable, which returns bytes written (or None)
+BENCHMARKS: Dict[str, Callable[[int], Callable[[], int | None]]] = {}
+# benchmarks that do not depend on face count, run once with faces 0
+UNSCALED: Set[str] = set()
+
+
+def benchmark(name: str, scaled: bool = True):
+    def register(setup: Callable[[int], Callable[[], int | None]]):
+        BENCHMARKS[name] = setup
+        if not scaled:
+            UNSCALED.add(name)
+        return setup
+
+    return register
+
+
+class ByteCounter:
+    """
+    File-like sink that only counts what is written
+    """
+
+    written: int
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data) -> int:
+        self.written += len(data)
+        return len(data)
+
+
+def box_positions(count: int) -> np.ndarray:
+    """
+    Touching unit boxes filling a roughly cubic block
+    """
+    side = max(1, math.ceil(count ** (1 / 3)))
+    grid = np.stack(
+        np.meshgrid(*[np.arange(side)] * 3, indexing="ij"), axis=-1
+    ).reshape(-1, 3)
+    return grid[:count].astype(np.float64)
+
+
+def boxes_state(faces: int) -> State:
+    state = State()
+    positions = box_positions(max(1, faces // 12))
+    state.boxes(np.concatenate((positions, np.ones((len(positions), 1))), axis=1))
+    return state
+
+
+@benchmark("generate.box")
+def bench_box(faces: int):
+    positions = box_positions(max(1, faces // 12))
+
+    def run():
+        state = State()
+        for x, y, z in positions:
+            state.box(x, y, z, 1)
+
+    return run
+
+
+@benchmark("generate.cuboid_gap")
+def bench_cuboid(faces: int):
+    positions = box_positions(max(1, faces // 32)) * 10
+
+    def run():
+        state = State()
+        for x, y, z in positions:
+            state.cuboid(x, y, z, 10, 10, 10, 2, 2, None)
+
+    return run
+
+
+@benchmark("generate.boxes")
+def bench_boxes(faces: int):
+    def run():
+        boxes_state(faces)
+
+    return run
+
+
+@benchmark("generate.grid")
+def bench_grid(faces: int):
+    side = max(1, math.isqrt(faces // 2))
+
+    def run():
+        State().grid(side, side, 1, 1)
+
+    return run
+
+
+@benchmark("generate.prism")
+def bench_prism(faces: int):
+    positions = box_positions(max(1, faces // 4))
+
+    def run():
+        state = State()
+        for x, y, z in positions:
+            state.prism(x, y, z, x + 1, y, z, x, y + 1, z, x, y, z + 1)
+
+    return run
+
+
+def unpruned(state: State, prune: Callable[[], None]) -> Callable[[], None]:
+    """
+    Timed callable running prune on the state as it was before the first run,
+    reruns would otherwise only see what earlier runs left enabled
+    """
+    face_count, wall_count = state.face_count, state.wall_count
+    disabled = state.disabled.copy()
+
+    def run():
+        state.face_count, state.wall_count = face_count, wall_count
+        state.disabled[:] = disabled
+        prune()
+
+    return run
+
+
+@benchmark("prune.faces")
+def bench_prune_faces(faces: int):
+    state = boxes_state(faces)
+    return unpruned(state, state.prune_duplicate_faces)
+
+
+@benchmark("prune.walls")
+def bench_prune_walls(faces: int):
+    state = boxes_state(faces)
+    return unpruned(state, state.prune_duplicate_walls)
+
+
+@benchmark("prune.hidden_walls")
+def bench_hidden_walls(faces: int):
+    state = boxes_state(faces)
+    return unpruned(state, state.remove_hidden_walls)
+
+
+def export_state(faces: int) -> State:
+    state = State()
+    side = max(1, math.isqrt(faces // 2))
+    state.grid(side, side, 1, 1)
+    state.prepare_export()
+    return state
+
+
+def export_arrays(faces: int) -> Tuple[NDArray, NDArray]:
+    # writers are timed on prepared arrays, State writers would prune again
+    return export_state(faces).enabled_faces()
+
+
+@benchmark("export.ascii_stl")
+def bench_ascii(faces: int):
+    vertices, normals = export_arrays(faces)
+    enabled = np.ones(len(vertices), bool)
+
+    def run():
+        sink = ByteCounter()
+        for chunk in iter_ascii_stl("bench", vertices, normals, enabled):
+            sink.write(chunk)
+        return sink.written
+
+    return run
+
+
+@benchmark("export.binary_stl")
+def bench_binary(faces: int):
+    vertices, normals = export_arrays(faces)
+
+    def run():
+        sink = ByteCounter()
+        write_binary_stl(sink, vertices, normals, "bench")
+        return sink.written
+
+    return run
+
+
+@benchmark("export.obj")
+def bench_obj(faces: int):
+    vertices, normals = export_arrays(faces)
+    points, faces_points = weld(vertices)
+    unique_normals, face_normals = weld(normals)
+
+    def run():
+        sink = ByteCounter()
+        write_obj(sink, points, unique_normals, faces_points, face_normals, "bench")
+        return sink.written
+
+    return run
+
+
+@benchmark("pyrender.load_obj")
+def bench_load_obj(faces: int):
+    import pyrender
+
+    state = export_state(faces)
+    f = tempfile.NamedTemporaryFile("w", suffix=".obj", delete=False)
+    with f:
+        state.write_obj(f)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            pyrender.dropCallback(None, [f.name])
+        return os.path.getsize(f.name)
+
+    run.cleanup = lambda: os.unlink(f.name)
+    return run
+
+
+def cli(*args: str) -> Callable[[], None]:
+    """
+    Timed callable running main.py in a fresh interpreter, as batch runs do
+    """
+    main = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+    def run():
+        subprocess.run([sys.executable, main, *args], check=True, stdout=subprocess.DEVNULL)
+
+    return run
+
+
+@benchmark("startup.help", scaled=False)
+def bench_startup_help(faces: int):
+    return cli("--help")
+
+
+@benchmark("startup.box", scaled=False)
+def bench_startup_box(faces: int):
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            cli(os.path.join(directory, "box.stl"), "-g", "example_box")()
+
+    return run
+
+
+def measure(name: str, faces: int, repeat: int) -> dict:
+    run = BENCHMARKS[name](faces)
+    seconds = []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = run()
+            seconds.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        # setups may attach cleanup() to remove files they created
+        getattr(run, "cleanup", lambda: None)()
+    return {
+        "name": name,
+        "faces": faces,
+        "seconds": min(seconds),
+        "peak_bytes": peak,
+        "output_bytes": output,
+    }
+
+
+def compare(results: List[dict], baseline: dict, threshold: float) -> List[str]:
+    """
+    Names of results slower than threshold times the same run of baseline
+    """
+    previous = {(r["name"], r["faces"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["name"], result["faces"]))
+        if old is None or old["seconds"] == 0:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        print(f"{result['name']:<22} {result['faces']:>10} {ratio:>8.2f}x")
+        if ratio > threshold:
+            regressions.append(f"{result['name']}@{result['faces']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks generation, pruning and export")
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"benchmark names or prefixes (default all): {', '.join(BENCHMARKS)}",
+    )
+    parser.add_argument(
+        "--scales",
+        "-s",
+        type=float,
+        nargs="+",
+        default=DEFAULT_SCALES,
+        help="approximate face counts to run at, eg. 1e3 1e5 1e7",
+    )
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="timed runs, best is kept")
+    parser.add_argument("--output", "-o", help="save results as json")
+    parser.add_argument("--compare", "-c", help="json of an earlier run to compare with")
+    parser.add_argument(
+        "--threshold",
+        "-t",
+        type=float,
+        default=1.25,
+        help="slowdown ratio reported as regression",
+    )
+    args = parser.parse_args()
+
+    names = [
+        name
+        for name in BENCHMARKS
+        if not args.benchmarks or any(name.startswith(b) for b in args.benchmarks)
+    ]
+
+    results = []
+    print(f"{'name':<22} {'faces':>10} {'seconds':>9} {'peak MB':>9} {'output MB':>10}")
+    for name in names:
+        for scale in [0] if name in UNSCALED else args.scales:
+            try:
+                result = measure(name, int(scale), args.repeat)
+            except ImportError as e:
+                print(f"{name:<22} skipped, {e}")
+                break
+            results.append(result)
+            output = result["output_bytes"]
+            print(
+                f"{name:<22} {result['faces']:>10} {result['seconds']:>9.4f} "
+                f"{result['peak_bytes'] / 2**20:>9.1f} "
+                f"{'' if output is None else f'{output / 2**20:.1f}':>10}"
+            )
+
+    report = {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("regressions:", ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
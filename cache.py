@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from functools import wraps
+from hashlib import blake2b
+from typing import TYPE_CHECKING, Callable, Iterator, List, Tuple
+import os
+import tempfile
+import numpy as np
+from numpy.typing import NDArray
+
+from export import STL_BATCH_SIZE, facets_str
+
+if TYPE_CHECKING:
+    from state import State
+
+# bump when primitives or stl formatting change, so old entries stop matching
+CACHE_VERSION = 1
+
+# calls producing fewer faces are cheaper to rebuild than to read back
+CACHE_MIN_FACES = 1024
+
+# a block of cached stl ends after a primitive call whose key is 0 modulo this,
+# so block boundaries follow content and survive edits elsewhere in the model
+BLOCK_SPREAD = 16
+
+
+def _feed(digest, value):
+    if isinstance(value, np.ndarray):
+        digest.update(f"array{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _feed(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f"dict{len(value)}".encode())
+        for key in sorted(value):
+            _feed(digest, key)
+            _feed(digest, value[key])
+    elif callable(value):
+        # progress callbacks and such do not change geometry
+        digest.update(b"callable;")
+    else:
+        digest.update(f"{type(value).__name__}:{value!r};".encode())
+
+
+def content_key(*parts) -> str:
+    digest = blake2b(digest_size=20)
+    _feed(digest, CACHE_VERSION)
+    for part in parts:
+        _feed(digest, part)
+    return digest.hexdigest()
+
+
+class GeometryCache:
+    """
+    Content addressed cache on disk, geometry of primitive calls is keyed on
+    their arguments and formatted stl blocks on the faces they contain
+    """
+
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.join(path, "geometry"), exist_ok=True)
+        os.makedirs(os.path.join(path, "blocks"), exist_ok=True)
+
+    def _file(self, kind: str, key: str) -> str:
+        extension = "npz" if kind == "geometry" else "stl"
+        return os.path.join(self.path, kind, f"{key}.{extension}")
+
+    def _store(self, path: str, write: Callable[[str], None]):
+        # write aside and rename, so concurrent runs never read partial files,
+        # unique temporary names keep threads of one process apart too
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(descriptor)
+        try:
+            write(temporary)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def load_geometry(self, key: str) -> Tuple[NDArray, NDArray, NDArray] | None:
+        try:
+            with np.load(self._file("geometry", key)) as data:
+                return data["vertices"], data["normals"], data["walls"]
+        except FileNotFoundError:
+            return None
+
+    def store_geometry(self, key: str, vertices: NDArray, normals: NDArray, walls: NDArray):
+        def write(path: str):
+            with open(path, "wb") as f:
+                np.savez(f, vertices=vertices, normals=normals, walls=walls)
+
+        self._store(self._file("geometry", key), write)
+
+    def block(self, vertices: NDArray, normals: NDArray, enabled: NDArray) -> str:
+        """
+        Ascii stl facets of enabled faces, formatted only when not cached yet
+        """
+        key = content_key(vertices, normals, enabled)
+        path = self._file("blocks", key)
+        try:
+            with open(path) as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        text = facets_str(vertices[enabled], normals[enabled])
+
+        def write(path: str):
+            with open(path, "w") as f:
+                f.write(text)
+
+        self._store(path, write)
+        return text
+
+
+def cached_primitive(method: Callable) -> Callable:
+    """
+    Makes State primitive look its geometry up in State.cache by arguments,
+    only the outermost call is cached and recorded as a segment for blocks
+    """
+
+    @wraps(method)
+    def wrapper(self: State, *args, **kwargs) -> State:
+        if self.cache is None or self._cache_depth > 0:
+            return method(self, *args, **kwargs)
+
+        key = content_key(method.__name__, args, kwargs)
+        start, wall_start = self.face_count, self.wall_count
+        self._cache_depth += 1
+        try:
+            hit = self.cache.load_geometry(key)
+            if hit is None:
+                method(self, *args, **kwargs)
+                if self.face_count - start >= CACHE_MIN_FACES:
+                    self.cache.store_geometry(
+                        key,
+                        self.vertices[start:],
+                        self.normals[start:],
+                        self.wall_faces[wall_start:] - start,
+                    )
+            else:
+                vertices, normals, walls = hit
+                self.append_faces(vertices, normals)
+                self.append_walls(walls + start)
+        finally:
+            self._cache_depth -= 1
+        self.segments.append((start, self.face_count, key))
+        return self
+
+    return wrapper
+
+
+def block_bounds(
+    face_count: int, segments: List[Tuple[int, int, str]], batch_size: int
+) -> List[Tuple[int, int]]:
+    """
+    Splits faces into blocks ending after segments whose key is 0 modulo
+    BLOCK_SPREAD (or once a block grows past batch_size), faces past the last
+    segment are one more block, blocks are then cut into batch_size pieces
+    """
+    ends = []
+    start = 0
+    for _, end, key in sorted(segments):
+        if int(key[:8], 16) % BLOCK_SPREAD == 0 or end - start >= batch_size:
+            ends.append(end)
+            start = end
+    ends.append(face_count)
+
+    bounds = []
+    start = 0
+    for end in ends:
+        for block in range(start, end, batch_size):
+            bounds.append((block, min(block + batch_size, end)))
+        start = max(start, end)
+    return bounds
+
+
+def iter_cached_ascii_stl(
+    cache: GeometryCache,
+    name: str,
+    vertices: NDArray,
+    normals: NDArray,
+    enabled: NDArray,
+    segments: List[Tuple[int, int, str]],
+    batch_size: int = STL_BATCH_SIZE,
+) -> Iterator[str]:
+    """
+    Same output as export.iter_ascii_stl, with blocks spliced from cache
+    """
+    yield f"solid {name}\n"
+    for start, end in block_bounds(len(vertices), segments, batch_size):
+        yield cache.block(vertices[start:end], normals[start:end], enabled[start:end])
+    yield "endsolid"
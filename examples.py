@@ -1,13 +1,22 @@
-from main import State
-
-from PIL import Image
+from typing import Callable, Dict
 import numpy as np
 
-def example_gap(state: State):
-    gap = 5
-    u = 50
+from state import State
+
+# generator name -> function filling a State, selected with main.py -g
+GENERATORS: Dict[str, Callable[..., None]] = {}
+
+
+def generator(function: Callable[..., None]) -> Callable[..., None]:
+    GENERATORS[function.__name__] = function
+    return function
+
+
+@generator
+def example_gap(state: State, u: float = 50, gap: float = 5):
     state.cuboid(u, 0, u, u, u, u, gap, None, gap)
 
+@generator
 def example_face(state: State):
     u = 10
     state.rect(
@@ -16,6 +25,7 @@ def example_face(state: State):
         u, 0, 0,
         0, -1, 0
     )
+@generator
 def window_part(state: State):
     small_arm = 10
     longer_arm = 15
@@ -31,18 +41,18 @@ def window_part(state: State):
 
     n = 10
     piece_width = long_arm/n
-    for i in range(n):
-        state.cuboid(
-            u+small_arm,
-            u+i*piece_width,
-            0,
-            u,
-            piece_width,
-            height,
-            None,
-            gap_border_width,
-            gap_border_width
-        )
+    pieces = np.arange(n)
+    state.cuboids(
+        np.stack([
+            np.full(n, u+small_arm),
+            u+pieces*piece_width,
+            np.zeros(n),
+            np.full(n, u),
+            np.full(n, piece_width),
+            np.full(n, height),
+        ], axis=1),
+        np.tile([np.nan, gap_border_width, gap_border_width], (n, 1))
+    )
 
 
     state.cuboid(u+small_arm,u+long_arm,0,u, u, height)
@@ -51,8 +61,30 @@ def window_part(state: State):
     state.cuboid(u+small_arm-longer_arm,long_arm,0,u, u, height)
     state.cuboid(u+small_arm-longer_arm,long_arm-u,0,u, u, height)
 
-def example_prism(state: State):
-    u = 40
+@generator
+def example_fence(state: State, posts: int = 10, u: float = 5, spacing: float = 20):
+    with state.group() as post:
+        state.cuboid(0, 0, 0, u, u, 4*u)
+        state.prism(
+            0, 0, 4*u,
+            u, 0, 4*u,
+            0, u, 4*u,
+            u/2, u/2, 5*u
+        )
+        state.prism(
+            u, 0, 4*u,
+            u, u, 4*u,
+            0, u, 4*u,
+            u/2, u/2, 5*u
+        )
+    post.array(posts, spacing, 0, 0)
+
+    with state.group() as rail:
+        state.cuboid(0, u/4, 3*u, spacing*(posts-1) + u, u/2, u/2)
+    rail.array(2, 0, 0, -2*u)
+
+@generator
+def example_prism(state: State, u: float = 40):
     p1 = (0, 0, u)
     p2 = (u, 0, u)
     p3 = (u, u, u)
@@ -72,9 +104,8 @@ def example_prism(state: State):
         *p5
     )
 
-def example_castle(state: State):
-    u = 30
-    gap = 3
+@generator
+def example_castle(state: State, u: float = 30, gap: float = 3):
 
     # BASE
     state.box(0,0,0, u)
@@ -111,8 +142,8 @@ def example_castle(state: State):
     state.cuboid(u,0,u, u,u,u, gap, gap, None)
     state.cuboid(u,u*2,u, u,u,u, gap, gap, None)
 
-def example_crown(state: State):
-    u = 40
+@generator
+def example_crown(state: State, u: float = 40):
     p1 = (0, 0, u)
     p2 = (u, 0, u)
     p3 = (u, u, u)
@@ -134,8 +165,8 @@ def example_crown(state: State):
         *p6,
     )
 
-def example_box(state: State):
-    u = 60
+@generator
+def example_box(state: State, u: float = 60):
     state.cuboid(
         0, 0, 0,
         u,u,u,
@@ -152,19 +183,30 @@ def example_box(state: State):
     state.box(0,-u,0,u)
     state.box(0,-u,u,u)
 
-def image(state: State):
-    path = "test.jpeg"
-    image = Image.open(path).convert('RGB')
-    image = np.asarray(image)
-    state.grid(len(image), len(image[0]), 3, 3)
-    # for [ y, row ] in enumerate( image ):
-    #     print(y)
-    #     for [ x, pixel ] in enumerate(row):
-    #         r,g,b = int(pixel[0]), int(pixel[1]), int(pixel[2])
-    #         intensity = (r+g+b)/(256*3)
-
-
-
+@generator
+def image(
+    state: State,
+    path: str = "test.jpeg",
+    cell_size: float = 3,
+    base: float = 3,
+    relief: float = 3,
+    lithophane: bool = False,
+):
+    """
+    Heightmap of image, brighter pixels are higher, lithophane makes darker
+    pixels thicker instead so the print shows the image against light
+    """
+    from PIL import Image
+
+    pixels = np.asarray(Image.open(path).convert('RGB'), np.float32)
+    intensity = pixels.sum(axis=2) / (256 * 3)
+    if lithophane:
+        intensity = 1 - intensity
+    state.heightmap(base + relief * intensity, cell_size)
+
+
+
+@generator
 def example_gap_cup(state: State):
     u = 50
     handle = 10
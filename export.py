@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, BinaryIO, Iterator, TextIO, Tuple
+from textwrap import indent
+import numpy as np
+from numpy.typing import NDArray
+
+# the process pool and shared memory load only for parallel writes
+if TYPE_CHECKING:
+    from multiprocessing.shared_memory import SharedMemory
+
+INDENT_TAB = " " * 4
+
+STL_HEADER_SIZE = 80
+
+STL_BATCH_SIZE = 16384
+
+OBJ_BATCH_SIZE = 65536
+
+FACET_TEMPLATE = indent(
+    "facet normal %.1f %.1f %.1f\n"
+    + indent("outer loop\n", INDENT_TAB)
+    + indent("vertex %.1f %.1f %.1f\n" * 3, INDENT_TAB * 2)
+    + indent("endloop\n", INDENT_TAB)
+    + "endfacet\n",
+    INDENT_TAB,
+)
+
+STL_DTYPE = np.dtype(
+    [
+        ("normal", "<f4", (3,)),
+        ("vertices", "<f4", (3, 3)),
+        ("attr", "<u2"),
+    ]
+)
+
+
+def facets_str(vertices: NDArray, normals: NDArray) -> str:
+    """
+    Formats (N,3,3) vertices and (N,3) normals as indented ascii stl facets
+    """
+    values = np.concatenate(
+        (normals.reshape(-1, 3), vertices.reshape(-1, 9)), axis=1
+    )
+    return (FACET_TEMPLATE * len(values)) % tuple(values.ravel().tolist())
+
+
+def iter_ascii_stl(
+    name: str,
+    vertices: NDArray,
+    normals: NDArray,
+    enabled: NDArray,
+    batch_size: int = STL_BATCH_SIZE,
+) -> Iterator[str]:
+    """
+    Yields ascii stl in chunks of at most batch_size facets, so memory stays
+    bounded by one batch no matter the mesh size
+    """
+    yield f"solid {name}\n"
+    for start in range(0, len(vertices), batch_size):
+        mask = enabled[start : start + batch_size]
+        yield facets_str(
+            vertices[start : start + batch_size][mask],
+            normals[start : start + batch_size][mask],
+        )
+    yield "endsolid"
+
+
+# (N,12) facet values of the shared memory block, set in pool workers
+_shared_facets: NDArray | None = None
+_shared_memory: SharedMemory | None = None
+
+
+def _attach_facets(name: str, count: int):
+    global _shared_facets, _shared_memory
+    from multiprocessing.shared_memory import SharedMemory
+
+    _shared_memory = SharedMemory(name=name)
+    _shared_facets = np.ndarray((count, 12), np.float32, _shared_memory.buf)
+
+
+def _format_facets(bounds: Tuple[int, int]) -> str:
+    facets = _shared_facets[bounds[0] : bounds[1]]
+    return facets_str(facets[:, 3:], facets[:, :3])
+
+
+def write_ascii_stl_parallel(
+    f: TextIO,
+    name: str,
+    vertices: NDArray,
+    normals: NDArray,
+    workers: int | None = None,
+    batch_size: int = STL_BATCH_SIZE,
+):
+    """
+    Writes ascii stl formatting batches in a process pool, facets are passed
+    through one shared memory block instead of pickling arrays to workers,
+    batches are written in order as they come back
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing.shared_memory import SharedMemory
+
+    count = len(vertices)
+    memory = SharedMemory(create=True, size=max(count * 12 * 4, 1))
+    try:
+        facets = np.ndarray((count, 12), np.float32, memory.buf)
+        facets[:, :3] = normals
+        facets[:, 3:] = vertices.reshape(-1, 9)
+        del facets
+
+        f.write(f"solid {name}\n")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_attach_facets,
+            initargs=(memory.name, count),
+        ) as executor:
+            bounds = [
+                (start, min(start + batch_size, count))
+                for start in range(0, count, batch_size)
+            ]
+            for chunk in executor.map(_format_facets, bounds):
+                f.write(chunk)
+        f.write("endsolid")
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def binary_stl_header(name: str) -> bytes:
+    """
+    80 byte header, must not start with "solid" or readers take it for ascii
+    """
+    return f"binary {name}".encode()[:STL_HEADER_SIZE].ljust(STL_HEADER_SIZE, b"\0")
+
+
+def write_binary_stl(f: BinaryIO, vertices: NDArray, normals: NDArray, name: str):
+    """
+    Writes (N,3,3) vertices and (N,3) normals as binary stl, records go out
+    in one write straight from their buffer
+    """
+    records = np.zeros(len(vertices), STL_DTYPE)
+    records["normal"] = normals
+    records["vertices"] = vertices
+
+    f.write(binary_stl_header(name) + np.uint32(len(records)).astype("<u4").tobytes())
+    f.write(memoryview(records).cast("B"))
+
+
+def _write_rows(f: TextIO, template: str, rows: NDArray, batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start : start + batch_size]
+        f.write((template * len(batch)) % tuple(batch.ravel().tolist()))
+
+
+def write_obj(
+    f: TextIO,
+    points: NDArray,
+    normals: NDArray,
+    faces: NDArray,
+    face_normals: NDArray,
+    name: str,
+    batch_size: int = OBJ_BATCH_SIZE,
+):
+    """
+    Writes indexed mesh as wavefront obj, (F,3) faces index points and every
+    face uses its single face_normals entry for all 3 corners
+    """
+    f.write(f"o {name}\n")
+    _write_rows(f, "v %.6g %.6g %.6g\n", points, batch_size)
+    _write_rows(f, "vn %.6g %.6g %.6g\n", normals, batch_size)
+    corners = np.empty((len(faces), 6), np.int64)
+    corners[:, 0::2] = faces + 1
+    corners[:, 1::2] = face_normals[:, None] + 1
+    _write_rows(f, "f %d//%d %d//%d %d//%d\n", corners, batch_size)
@@ -1,15 +1,24 @@
 #!/usr/bin/env python
 
+from __future__ import annotations
+
 import argparse
-from examples import *
-import os
-from state import State
+from itertools import product
+import sys
+import time
+from typing import TYPE_CHECKING, Dict, List
+from timing import Profiler
+
+# numpy, PIL and the generators load on first use, keeps --help and short
+# batch runs quick to start
+if TYPE_CHECKING:
+    from state import State
 
 def main():
     parser = argparse.ArgumentParser(description="Generates obj files from code")
 
     parser.add_argument(
-        "filename", metavar="filename", type=str, help="file to output .obj to"
+        "filename", metavar="filename", type=str, help="file to output to, .obj writes wavefront obj, anything else stl"
     )
 
     parser.add_argument(
@@ -21,24 +30,280 @@ def main():
         default=False,
         help="preview after generate",
     )
-    args = parser.parse_args()
 
+    parser.add_argument(
+        "--lod",
+        dest="lod",
+        type=int,
+        default=None,
+        help="preview at most this many triangles, the written file keeps full detail",
+    )
+
+    parser.add_argument(
+        "--format",
+        "-f",
+        dest="format",
+        choices=["ascii", "binary"],
+        default="ascii",
+        help="stl flavour to write",
+    )
+
+    parser.add_argument(
+        "--simplify",
+        "-s",
+        dest="simplify",
+        action="store_const",
+        const=True,
+        default=False,
+        help="merge coplanar faces into as few rectangles as possible",
+    )
+
+    parser.add_argument(
+        "--normals",
+        "-n",
+        dest="recompute_normals",
+        action="store_const",
+        const=True,
+        default=False,
+        help="recompute unit face normals on export, keeping the side stored normals point to",
+    )
+
+    parser.add_argument(
+        "--generator",
+        "-g",
+        dest="generators",
+        action="append",
+        help="generator function from examples, repeat in batch mode (default image)",
+    )
 
-    state = State()
+    parser.add_argument(
+        "--param",
+        "-P",
+        dest="params",
+        action="append",
+        default=[],
+        help="generator parameter key=value (int, float, True/False or text), key=v1,v2,... sweeps all values in batch mode",
+    )
 
-    generate_logic(state)
+    parser.add_argument(
+        "--batch",
+        "-b",
+        dest="batch_mode",
+        action="store_const",
+        const=True,
+        default=False,
+        help="run every generator for every parameter combination in parallel, "
+        "filename is a pattern where {name} is replaced per job",
+    )
 
-    state.update_str_state()
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        dest="jobs",
+        type=int,
+        default=None,
+        help="worker processes in batch mode (default cpu count)",
+    )
 
-    with open(args.filename, "w") as f:
-        f.write(state.stl_str)
+    parser.add_argument(
+        "--workers",
+        "-w",
+        dest="workers",
+        type=int,
+        default=1,
+        help="processes formatting ascii stl of large meshes (0 for cpu count)",
+    )
+
+    parser.add_argument(
+        "--cache",
+        "-c",
+        dest="cache",
+        default=None,
+        help="directory caching primitive geometry and formatted stl between runs",
+    )
+
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_const",
+        const=True,
+        default=False,
+        help="print time, faces, allocations and peak RSS of each pipeline stage",
+    )
+
+    parser.add_argument(
+        "--profile-output",
+        dest="profile_output",
+        default=None,
+        help="also dump cProfile stats of the run to this file (implies --profile)",
+    )
+    args = parser.parse_args()
+
+    generators = args.generators or ["image"]
+    sweep = parse_params(args.params)
+    options = {
+        "format": args.format,
+        "simplify": args.simplify,
+        "recompute_normals": args.recompute_normals,
+        "workers": args.workers or None,
+        "cache": args.cache,
+    }
+
+    if args.batch_mode:
+        jobs = [
+            (generator, params, args.filename.format(name=job_name(generator, params)))
+            for generator in generators
+            for params in (dict(zip(sweep, values)) for values in product(*sweep.values()))
+        ]
+        filenames = [filename for _, _, filename in jobs]
+        if len(set(filenames)) < len(filenames):
+            raise Exception(
+                f"batch filename {args.filename} gives several jobs the same file, use {{name}} in it"
+            )
+        print_summary(run_batch(jobs, options, args.jobs))
+        return
+
+    swept = [key for key, values in sweep.items() if len(values) > 1]
+    if len(generators) > 1 or swept:
+        raise Exception(
+            "several generators or values given ("
+            + ", ".join((["-g"] if len(generators) > 1 else []) + [f"-P {key}" for key in swept])
+            + "), use --batch to run each of them"
+        )
+    params = {key: values[0] for key, values in sweep.items()}
+    profiler = Profiler() if args.profile or args.profile_output else None
+    job = (generators[0], params, args.filename, options, profiler)
+    if args.profile_output:
+        import cProfile
+
+        run = cProfile.Profile()
+        state = run.runcall(build_state, *job)
+        run.dump_stats(args.profile_output)
+    else:
+        state = build_state(*job)
+    if profiler is not None:
+        print(profiler.table(), file=sys.stderr)
 
     if args.preview_mode:
-        os.system(f"stlviewer {args.filename}")
+        import pyrender
+
+        # hand the arrays over directly, no need to read the file back
+        pyrender.start(state, args.lod)
+
+
+def parse_value(value: str):
+    if value in ("True", "False"):
+        return value == "True"
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_params(params: List[str]) -> Dict[str, list]:
+    """
+    Parses ["u=10,20", "gap=3"] into {"u": [10, 20], "gap": [3]}
+    """
+    sweep = {}
+    for param in params:
+        key, _, values = param.partition("=")
+        sweep[key] = [parse_value(value) for value in values.split(",")]
+    return sweep
+
+
+def job_name(generator: str, params: dict) -> str:
+    return "-".join([generator] + [f"{key}={value}" for key, value in params.items()])
+
+
+def write_state(state: State, filename: str, format: str, workers: int | None = 1):
+    if filename.lower().endswith(".obj"):
+        with open(filename, "w") as f:
+            state.write_obj(f)
+    elif format == "binary":
+        with open(filename, "wb") as f:
+            state.write_binary_stl(f)
+    else:
+        with open(filename, "w") as f:
+            state.write_stl(f, workers=workers)
+
+
+def run_job(generator: str, params: dict, filename: str, options: dict) -> dict:
+    """
+    Generates and writes one model with its own State, returns its summary
+    """
+    start = time.perf_counter()
+    state = build_state(generator, params, filename, options)
+    return {
+        "name": job_name(generator, params),
+        "filename": filename,
+        "faces": int((~state.disabled).sum()),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def build_state(
+    generator: str,
+    params: dict,
+    filename: str,
+    options: dict,
+    profiler: Profiler | None = None,
+) -> State:
+    """
+    Generates one model into its own State and writes it to filename
+    """
+    from cache import GeometryCache
+    from state import State
+
+    state = State(
+        simplify=options["simplify"],
+        recompute_normals=options["recompute_normals"],
+        cache=GeometryCache(options["cache"]) if options["cache"] else None,
+        profiler=profiler,
+    )
+    with state.stage("generate"):
+        generate_logic(state, generator, **params)
+    with state.stage("export"):
+        write_state(state, filename, options["format"], options["workers"])
+    return state
+
+
+def _run_job(job: tuple, options: dict) -> dict:
+    return run_job(*job, options)
+
+
+def run_batch(jobs: List[tuple], options: dict, workers: int | None = None) -> List[dict]:
+    """
+    Runs (generator, params, filename) jobs across a process pool, each worker
+    builds and writes its models independently, summaries come in job order
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_run_job, jobs, [options] * len(jobs)))
+
+
+def print_summary(results: List[dict]):
+    width = max([len(result["name"]) for result in results] + [4])
+    print(f"{'name':<{width}} {'faces':>10} {'seconds':>9}  file")
+    for result in results:
+        print(
+            f"{result['name']:<{width}} {result['faces']:>10} "
+            f"{result['seconds']:>9.3f}  {result['filename']}"
+        )
+    print(
+        f"{len(results)} jobs, {sum(result['faces'] for result in results)} faces, "
+        f"{sum(result['seconds'] for result in results):.3f}s of work"
+    )
+
 
+def generate_logic(state: State, generator: str = "image", **params):
+    from examples import GENERATORS
 
-def generate_logic(state: State):
-    image(state)
+    if generator not in GENERATORS:
+        raise Exception(f"unknown generator {generator}, choose from: {', '.join(GENERATORS)}")
+    GENERATORS[generator](state, **params)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,546 @@
+from __future__ import annotations
+
+import math
+from typing import Tuple
+import numpy as np
+from numpy.typing import NDArray
+
+QUANTUM = 1e-4
+LOD_MAX_RESOLUTION = 1 << 12
+# planes whose compressed raster outgrows their rect count this much are
+# scattered rects greedy meshing hardly merges
+MAX_RASTER_CELLS_PER_RECT = 16
+
+
+def quantize(points: NDArray) -> NDArray:
+    """
+    Snaps coordinates to integer multiples of QUANTUM
+    """
+    return np.round(np.asarray(points, np.float64) / QUANTUM).astype(np.int64)
+
+
+def _lexicographic_less(a: NDArray, b: NDArray) -> NDArray:
+    return (a[:, 0] < b[:, 0]) | (
+        (a[:, 0] == b[:, 0])
+        & ((a[:, 1] < b[:, 1]) | ((a[:, 1] == b[:, 1]) & (a[:, 2] < b[:, 2])))
+    )
+
+
+def canonical_keys(points: NDArray) -> NDArray:
+    """
+    Turns (N,K,3) point groups into (N,K*3) rows of quantized points sorted
+    lexicographically, so groups holding the same points get equal rows
+    """
+    quantized = quantize(points)
+    k = quantized.shape[1]
+    # bubble sorting network, K is 3 or 4 so this is a handful of passes
+    for end in range(k - 1, 0, -1):
+        for i in range(end):
+            a = quantized[:, i].copy()
+            b = quantized[:, i + 1]
+            swap = _lexicographic_less(b, a)
+            quantized[swap, i] = b[swap]
+            quantized[swap, i + 1] = a[swap]
+    return quantized.reshape(len(quantized), k * 3)
+
+
+def group_rows(keys: NDArray) -> Tuple[NDArray, NDArray, NDArray]:
+    """
+    Groups equal rows, returns first index, inverse and count of every group
+    """
+    rows = np.ascontiguousarray(keys)
+    rows = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1])))
+    _, first, inverse, counts = np.unique(
+        rows.ravel(), return_index=True, return_inverse=True, return_counts=True
+    )
+    return first, inverse.ravel(), counts
+
+
+def duplicate_faces(vertices: NDArray, normals: NDArray) -> NDArray:
+    """
+    Mask of faces to drop: coincident faces facing the same way keep only the
+    first one, coincident faces facing opposite ways are all dropped
+    """
+    return _duplicates(canonical_keys(vertices), normals)
+
+
+def duplicate_walls(corners: NDArray, normals: NDArray) -> NDArray:
+    """
+    Mask of (N,4,3) wall corners to drop, same rule as duplicate_faces
+    """
+    return _duplicates(canonical_keys(corners), normals)
+
+
+def _duplicates(keys: NDArray, normals: NDArray) -> NDArray:
+    first, inverse, counts = group_rows(keys)
+    duplicated = counts[inverse] > 1
+
+    same_side = np.einsum("ij,ij->i", normals, normals[first[inverse]]) > 0
+    mixed = np.zeros(len(counts), bool)
+    mixed[inverse[~same_side]] = True
+
+    return duplicated & (mixed[inverse] | (first[inverse] != np.arange(len(inverse))))
+
+
+def weld(points: NDArray) -> Tuple[NDArray, NDArray]:
+    """
+    Merges (N,...,3) points closer than QUANTUM into a shared (V,3) table,
+    returns the table and an (N,...) array of indices into it
+    """
+    flat = np.asarray(points).reshape(-1, 3)
+    first, inverse, _ = group_rows(quantize(flat))
+    return flat[first], inverse.reshape(np.shape(points)[:-1])
+
+
+def face_normals(vertices: NDArray) -> NDArray:
+    """
+    Unit normals of (N,3,3) triangles following their winding, zero for
+    degenerate ones
+    """
+    vertices = np.asarray(vertices, np.float64)
+    normals = np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+
+# in plane axes (u, v) for each normal axis, chosen so u x v points along it
+PLANE_AXES = ((1, 2), (2, 0), (0, 1))
+
+
+def rect_faces(
+    axis: int | NDArray,
+    sign: int | NDArray,
+    offset: float | NDArray,
+    u0: NDArray,
+    u1: NDArray,
+    v0: NDArray,
+    v1: NDArray,
+) -> NDArray:
+    """
+    (2R,3,3) triangles covering R axis aligned rectangles in plane
+    coordinate[axis] == offset, wound so they face sign along axis, axis,
+    sign and offset are scalars or given per rectangle
+    """
+    count = len(u0)
+    axis, sign, offset = (np.broadcast_to(x, count) for x in (axis, sign, offset))
+    u_axis, v_axis = np.array(PLANE_AXES)[axis].T
+    rows, corner = np.arange(count)[:, None], np.arange(4)
+    corners = np.zeros((count, 4, 3))
+    corners[rows, corner, axis[:, None]] = offset[:, None]
+    corners[rows, corner, u_axis[:, None]] = np.stack((u0, u1, u1, u0), axis=1)
+    corners[rows, corner, v_axis[:, None]] = np.stack((v0, v0, v1, v1), axis=1)
+    order = np.where(sign[:, None] > 0, [0, 1, 2, 0, 2, 3], [0, 3, 2, 0, 2, 1])
+    return corners[rows, order].reshape(-1, 3, 3)
+
+
+def greedy_rectangles(covered: NDArray) -> Tuple[NDArray, NDArray, NDArray, NDArray]:
+    """
+    Splits 2D boolean raster into rectangles, runs of cells along v are merged
+    with identical runs of the following rows, returns u0, u1, v0, v1 cell bounds
+    """
+    padded = np.zeros((covered.shape[0], covered.shape[1] + 2), np.int8)
+    padded[:, 1:-1] = covered
+    steps = np.diff(padded, axis=1)
+    rows, v0 = np.nonzero(steps == 1)
+    _, v1 = np.nonzero(steps == -1)
+
+    order = np.lexsort((rows, v1, v0))
+    rows, v0, v1 = rows[order], v0[order], v1[order]
+    new = np.ones(len(rows), bool)
+    new[1:] = (v0[1:] != v0[:-1]) | (v1[1:] != v1[:-1]) | (rows[1:] != rows[:-1] + 1)
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], len(rows))[: len(starts)] - 1
+    return rows[starts], rows[ends] + 1, v0[starts], v1[starts]
+
+
+def _cover(shape: Tuple[int, int], iu0, iu1, iv0, iv1) -> NDArray:
+    """
+    Boolean raster of cells covered by any of the given cell rectangles
+    """
+    coverage = np.zeros((shape[0] + 1, shape[1] + 1), np.int64)
+    np.add.at(coverage, (iu0, iv0), 1)
+    np.add.at(coverage, (iu1, iv0), -1)
+    np.add.at(coverage, (iu0, iv1), -1)
+    np.add.at(coverage, (iu1, iv1), 1)
+    return coverage.cumsum(axis=0).cumsum(axis=1)[:-1, :-1] > 0
+
+
+def coplanar_rectangles(
+    vertices: NDArray, normals: NDArray
+) -> Tuple[NDArray, NDArray, NDArray]:
+    """
+    Finds axis aligned faces that pairwise fill rectangles and re-meshes every
+    plane of them into as few rectangles as greedy meshing gives, returns mask
+    of replaced faces with vertices and normals of the replacement
+    """
+    replaced = np.zeros(len(vertices), bool)
+    new_vertices = [np.zeros((0, 3, 3))]
+    new_normals = [np.zeros((0, 3))]
+
+    units = face_normals(vertices)
+    stored = np.sign(np.asarray(normals, np.float64))
+    axis = np.argmax(np.abs(units), axis=1)
+    quantized = quantize(vertices)
+    index = np.arange(len(vertices))
+    aligned = (
+        (np.abs(units[index, axis]) > 1 - 1e-6)
+        & (quantized[index, 0, axis] == quantized[index, 1, axis])
+        & (quantized[index, 0, axis] == quantized[index, 2, axis])
+        & (np.sign(units[index, axis]) == stored[index, axis])
+    )
+    candidates = np.flatnonzero(aligned)
+    if len(candidates) < 4:
+        return replaced, new_vertices[0], new_normals[0]
+
+    axis = axis[candidates]
+    sign = np.sign(units[candidates, axis]).astype(np.int64)
+    points = quantized[candidates]
+    offset = points[:, 0][np.arange(len(candidates)), axis]
+    u_axis, v_axis = np.array(PLANE_AXES)[axis].T
+    u = np.take_along_axis(points, u_axis[:, None, None], axis=2)[:, :, 0]
+    v = np.take_along_axis(points, v_axis[:, None, None], axis=2)[:, :, 0]
+    u_min, u_max = u.min(axis=1), u.max(axis=1)
+    v_min, v_max = v.min(axis=1), v.max(axis=1)
+
+    # faces are rect halves when all their corners are bbox corners, the
+    # corner missing from each tells which half it is, corner bits are
+    # 0 (u_min, v_min), 1 (u_max, v_min), 2 (u_min, v_max), 3 (u_max, v_max)
+    at_u_max = u == u_max[:, None]
+    at_v_max = v == v_max[:, None]
+    on_corners = ((u == u_min[:, None]) | at_u_max) & ((v == v_min[:, None]) | at_v_max)
+    corner_bits = np.bitwise_or.reduce(
+        1 << (at_u_max.astype(np.int64) + 2 * at_v_max), axis=1
+    )
+    missing = 0b1111 & ~corner_bits
+    halves = on_corners.all(axis=1) & np.isin(missing, (1, 2, 4, 8))
+    missing = np.where(halves, missing, 0)
+
+    first, inverse, _ = group_rows(
+        np.stack((axis, sign, offset, u_min, u_max, v_min, v_max), axis=1)
+    )
+    order = np.argsort(inverse, kind="stable")
+    starts = np.searchsorted(inverse[order], np.arange(len(first)))
+    group_missing = np.bitwise_or.reduceat(missing[order], starts)
+    filled = ((group_missing & 0b1001) == 0b1001) | ((group_missing & 0b0110) == 0b0110)
+    filled_faces = filled[inverse] & halves
+
+    _, plane, _ = group_rows(np.stack((axis, sign, offset), axis=1))
+    rects = first[filled]
+    plane_rect_counts = np.bincount(plane[rects], minlength=plane.max() + 1)
+
+    merged = np.flatnonzero(filled_faces & (plane_rect_counts[plane] > 1))
+    merged = merged[np.argsort(plane[merged], kind="stable")]
+    rects = rects[plane_rect_counts[plane[rects]] > 1]
+    rects = rects[np.argsort(plane[rects], kind="stable")]
+    if len(rects) == 0:
+        return replaced, new_vertices[0], new_normals[0]
+    face_splits = np.flatnonzero(np.diff(plane[merged])) + 1
+    rect_splits = np.flatnonzero(np.diff(plane[rects])) + 1
+
+    for faces, plane_rects in zip(
+        np.split(merged, face_splits), np.split(rects, rect_splits)
+    ):
+        plane_axis = int(axis[plane_rects[0]])
+        plane_sign = int(sign[plane_rects[0]])
+        plane_offset = offset[plane_rects[0]]
+
+        us = np.unique(np.concatenate((u_min[plane_rects], u_max[plane_rects])))
+        vs = np.unique(np.concatenate((v_min[plane_rects], v_max[plane_rects])))
+        if (len(us) - 1) * (len(vs) - 1) > MAX_RASTER_CELLS_PER_RECT * len(plane_rects):
+            continue
+        covered = _cover(
+            (len(us) - 1, len(vs) - 1),
+            np.searchsorted(us, u_min[plane_rects]),
+            np.searchsorted(us, u_max[plane_rects]),
+            np.searchsorted(vs, v_min[plane_rects]),
+            np.searchsorted(vs, v_max[plane_rects]),
+        )
+
+        u0, u1, v0, v1 = greedy_rectangles(covered)
+        if 2 * len(u0) >= len(faces):
+            continue
+
+        replaced[candidates[faces]] = True
+        new_vertices.append(
+            rect_faces(
+                plane_axis,
+                plane_sign,
+                plane_offset * QUANTUM,
+                us[u0] * QUANTUM,
+                us[u1] * QUANTUM,
+                vs[v0] * QUANTUM,
+                vs[v1] * QUANTUM,
+            )
+        )
+        direction = np.zeros(3)
+        direction[plane_axis] = plane_sign
+        new_normals.append(np.tile(direction, (2 * len(u0), 1)))
+
+    return replaced, np.concatenate(new_vertices), np.concatenate(new_normals)
+
+
+def hidden_walls(
+    corners: NDArray, normals: NDArray
+) -> Tuple[NDArray, NDArray, NDArray]:
+    """
+    Finds axis aligned (W,4,3) walls overlapping an opposite facing wall in the
+    same plane, returns mask of them and (R,2,3,3) faces with (R,3) normals
+    of their parts left visible once the overlap is cut away
+    """
+    hidden = np.zeros(len(corners), bool)
+    empty = np.zeros((0, 2, 3, 3)), np.zeros((0, 3))
+
+    normals = np.asarray(normals, np.float64)
+    axis = np.argmax(np.abs(normals), axis=1)
+    index = np.arange(len(corners))
+    quantized = quantize(corners)
+    offset = quantized[index, 0, axis]
+    flat = (quantized[index, :, axis] == offset[:, None]).all(axis=1) & (
+        np.abs(normals[index, axis]) > 1 - 1e-6
+    )
+    sign = np.sign(normals[index, axis]).astype(np.int64)
+
+    u_axis, v_axis = np.array(PLANE_AXES)[axis].T
+    u = np.take_along_axis(quantized, u_axis[:, None, None], axis=2)[:, :, 0]
+    v = np.take_along_axis(quantized, v_axis[:, None, None], axis=2)[:, :, 0]
+    u_min, u_max = u.min(axis=1), u.max(axis=1)
+    v_min, v_max = v.min(axis=1), v.max(axis=1)
+
+    walls = np.flatnonzero(flat & (u_min < u_max) & (v_min < v_max))
+    if len(walls) < 2:
+        return hidden, *empty
+
+    # sort and sweep over u within bands along v as tall as the tallest wall
+    # of the plane, every wall goes into the bands holding its v ends so two
+    # overlapping walls always share one, then a wall can only overlap the
+    # walls after it in its band whose u_min falls before its u_max
+    _, plane = np.unique(offset[walls] * 3 + axis[walls], return_inverse=True)
+    # only planes holding walls facing both ways can hide anything
+    up, down = np.bincount(plane, sign[walls] > 0), np.bincount(plane, sign[walls] < 0)
+    both = (up > 0) & (down > 0)
+    walls, plane = walls[both[plane]], plane[both[plane]]
+    if len(walls) == 0:
+        return hidden, *empty
+    height = np.zeros(plane.max() + 1, np.int64)
+    np.maximum.at(height, plane, v_max[walls] - v_min[walls])
+    low = np.zeros(len(corners), np.int64)
+    low[walls] = v_min[walls] // height[plane]
+    two = np.zeros(len(corners), bool)
+    two[walls] = low[walls] != v_max[walls] // height[plane]
+    upper = np.repeat((False, True), (len(walls), two.sum()))
+    plane = np.concatenate((plane, plane[two[walls]]))
+    walls = np.concatenate((walls, walls[two[walls]]))
+    bands = low[walls] + upper
+    bands = plane * (bands.max() - bands.min() + 1) + bands
+    _, band = np.unique(bands, return_inverse=True)
+
+    base = u_min[walls].min()
+    span = u_max[walls].max() - base + 1
+    starts = band * span + (u_min[walls] - base)
+    order = np.argsort(starts, kind="stable")
+    walls, band, starts, upper = walls[order], band[order], starts[order], upper[order]
+    ends = band * span + (u_max[walls] - base)
+    counts = np.searchsorted(starts, ends) - np.arange(len(walls)) - 1
+    first = np.repeat(np.arange(len(walls)), counts)
+    skip = np.repeat(np.cumsum(counts) - counts, counts)
+    second = first + 1 + np.arange(counts.sum()) - skip
+    upper, first, second = upper[first], walls[first], walls[second]
+    overlapping = (
+        (sign[first] != sign[second])
+        & (v_min[first] < v_max[second])
+        & (v_min[second] < v_max[first])
+        # walls sharing both their bands pair up in each, the upper is dropped
+        & ~(upper & two[first] & two[second] & (low[first] == low[second]))
+    )
+    first, second = first[overlapping], second[overlapping]
+    if len(first) == 0:
+        return hidden, *empty
+
+    # both walls of a pair hide each other, each is cut locally by the
+    # opposite walls it overlaps one at a time in order of their u_min, so
+    # pieces ending before the next cut are final
+    owner = np.concatenate((first, second))
+    cutter = np.concatenate((second, first))
+    order = np.lexsort((u_min[cutter], owner))
+    owner, cutter = owner[order], cutter[order]
+    new = np.ones(len(owner), bool)
+    new[1:] = owner[1:] != owner[:-1]
+    walls, local = owner[new], np.cumsum(new) - 1
+    counts = np.diff(np.append(np.flatnonzero(new), len(owner)))
+    hidden[walls] = True
+    rank = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    pieces = np.stack(
+        (np.arange(len(walls)), u_min[walls], u_max[walls], v_min[walls], v_max[walls]),
+        axis=1,
+    )
+    bounds = np.stack((u_min, u_max, v_min, v_max), axis=1)
+    bounds = np.append(bounds, [[1, 0, 1, 0]], axis=0)
+    by_step = np.argsort(rank, kind="stable")
+    steps = np.searchsorted(rank[by_step], np.arange(counts.max() + 2))
+    cuts = np.full(len(walls), -1)
+    following = np.full(len(walls), np.iinfo(np.int64).max)
+    done = []
+    for step in range(counts.max()):
+        now = by_step[steps[step] : steps[step + 1]]
+        after = by_step[steps[step + 1] : steps[step + 2]]
+        cuts[local[now]] = cutter[now]
+        following[local[now]] = np.iinfo(np.int64).max
+        following[local[after]] = u_min[cutter[after]]
+        pieces = _subtract(pieces, cuts[pieces[:, 0]], bounds)
+        cuts[local[now]] = -1
+        active = pieces[:, 2] > following[pieces[:, 0]]
+        done.append(pieces[~active])
+        pieces = pieces[active]
+
+    pieces = np.concatenate(done)
+    wall = walls[pieces[:, 0]]
+    order = np.lexsort((wall, sign[wall], axis[wall]))
+    pieces, wall = pieces[order], wall[order]
+    faces = rect_faces(
+        axis[wall],
+        sign[wall],
+        offset[wall] * QUANTUM,
+        *(pieces[:, 1:].T * QUANTUM),
+    )
+    new_normals = np.zeros((len(wall), 3))
+    new_normals[np.arange(len(wall)), axis[wall]] = sign[wall]
+    return hidden, faces.reshape(-1, 2, 3, 3), new_normals
+
+
+def _subtract(pieces: NDArray, cuts: NDArray, bounds: NDArray) -> NDArray:
+    """
+    Cuts (W,4) bounds rows u0, u1, v0, v1 of walls cuts[i] out of (P,5) rows
+    of owner, u0, u1, v0, v1, the last bounds row is empty so -1 leaves the
+    piece whole, returns the up to four remaining pieces of each
+    """
+    owner, u0, u1, v0, v1 = pieces.T
+    c_u0, c_u1, c_v0, c_v1 = bounds[cuts].T
+    c_u0, c_u1 = np.maximum(c_u0, u0), np.minimum(c_u1, u1)
+    c_v0, c_v1 = np.maximum(c_v0, v0), np.minimum(c_v1, v1)
+    missed = (c_u0 >= c_u1) | (c_v0 >= c_v1)
+    covered = (c_u0 == u0) & (c_u1 == u1) & (c_v0 == v0) & (c_v1 == v1)
+    split = ~missed & ~covered
+    owner, u0, u1, v0, v1 = owner[split], u0[split], u1[split], v0[split], v1[split]
+    c_u0, c_u1, c_v0, c_v1 = c_u0[split], c_u1[split], c_v0[split], c_v1[split]
+    # full height strips left and right of the cut, top and bottom between
+    rest = np.concatenate(
+        (
+            np.stack((owner, u0, c_u0, v0, v1), axis=1),
+            np.stack((owner, c_u1, u1, v0, v1), axis=1),
+            np.stack((owner, c_u0, c_u1, v0, c_v0), axis=1),
+            np.stack((owner, c_u0, c_u1, c_v1, v1), axis=1),
+        )
+    )
+    rest = rest[(rest[:, 1] < rest[:, 2]) & (rest[:, 3] < rest[:, 4])]
+    return np.concatenate((pieces[missed], rest))
+
+
+def cluster_vertices(vertices: NDArray, resolution: int) -> Tuple[NDArray, NDArray]:
+    """
+    Vertex clustering: snaps corners of (N,3,3) triangles to the mean of
+    their cell in a grid of resolution cells along the longest side, drops
+    triangles that collapse and repeats with the same winding. Returns the
+    triangles and for every input triangle the one it went into, -1 if none
+    """
+    points = np.asarray(vertices, np.float64).reshape(-1, 3)
+    low = points.min(axis=0)
+    extent = (points.max(axis=0) - low).max() or 1.0
+    centers, corners, source = _cluster((points - low) / extent, resolution)
+    return (centers * extent + low)[corners].astype(np.asarray(vertices).dtype), source
+
+
+def _cluster(points: NDArray, resolution: int) -> Tuple[NDArray, NDArray, NDArray]:
+    """
+    Clusters corners given in the unit cube, returns cluster centers, (M,3)
+    center indices of the kept triangles and the source map
+    """
+    cells = np.minimum((points * resolution).astype(np.int64), resolution - 1)
+    keys = (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+    _, cluster = np.unique(keys, return_inverse=True)
+    cluster = cluster.ravel()
+    counts = np.bincount(cluster)
+    centers = np.stack(
+        [np.bincount(cluster, points[:, axis]) / counts for axis in range(3)], axis=1
+    )
+
+    corners = cluster.reshape(-1, 3)
+    kept = np.flatnonzero(
+        (corners[:, 0] != corners[:, 1])
+        & (corners[:, 1] != corners[:, 2])
+        & (corners[:, 2] != corners[:, 0])
+    )
+    corners = corners[kept]
+    # rotate smallest cluster first, keeps winding so both sides of thin walls stay
+    shift = np.argmin(corners, axis=1)[:, None] + np.arange(3)
+    rotated = np.take_along_axis(corners, shift % 3, axis=1)
+    first, inverse, _ = group_rows(rotated)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    source = np.full(len(points) // 3, -1, np.int64)
+    source[kept] = rank[inverse]
+    return centers, corners[first[order]], source
+
+
+def decimate(vertices: NDArray, normals: NDArray, target: int) -> Tuple[NDArray, NDArray]:
+    """
+    Reduces (N,3,3) triangles to at most target by vertex clustering with
+    close to the finest grid that fits. The grid is guessed from the face
+    count scaling with its square and narrowed between grids known to fit
+    and not to fit. Normals point the way the area weighted stored normals
+    of the merged triangles do. Returns input when within budget, the
+    coarsest non empty clustering when no grid fits
+    """
+    if len(vertices) <= target:
+        return vertices, normals
+    points = np.asarray(vertices, np.float64).reshape(-1, 3)
+    start = points.min(axis=0)
+    extent = (points.max(axis=0) - start).max() or 1.0
+    points = (points - start) / extent
+
+    best = coarsest = None
+    low, high = 0, LOD_MAX_RESOLUTION + 1
+    resolution = min(max(math.isqrt(target), 1), LOD_MAX_RESOLUTION)
+    # stop once the finest fitting grid is known within an eighth
+    while high - low > max(1, low // 8):
+        clustered = _cluster(points, resolution)
+        count = len(clustered[1])
+        if count <= target:
+            # an empty clustering fits too, finer grids may still fit
+            low = resolution
+            best = clustered if count else best
+        else:
+            high = resolution
+            if count > 0 and (coarsest is None or count < len(coarsest[1])):
+                coarsest = clustered
+        guess = int(resolution * math.sqrt(0.95 * target / max(count, 1)))
+        resolution = guess if low < guess < high else (low + high) // 2
+    if best is None:
+        # every grid fitting the budget collapses the mesh, showing the
+        # smallest clustering over budget beats showing nothing
+        if coarsest is None or len(coarsest[1]) >= len(vertices):
+            return vertices, normals
+        best = coarsest
+    centers, corners, source = best
+    triangles = (centers * extent + start)[corners]
+
+    # area weighted stored normals summed per merged triangle
+    sides = np.cross(
+        vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0], axis=1
+    ).astype(np.float64)
+    weights = np.linalg.norm(sides, axis=1)[:, None] * np.asarray(normals, np.float64)
+    merged = source >= 0
+    stored = np.stack(
+        [
+            np.bincount(source[merged], weights[merged, axis], len(corners))
+            for axis in range(3)
+        ],
+        axis=1,
+    )
+    new = face_normals(triangles)
+    new[np.einsum("ij,ij->i", new, stored) < 0] *= -1
+    # clusters may still line up into slivers without area
+    keep = new.any(axis=1)
+    dtype = np.asarray(vertices).dtype
+    return triangles[keep].astype(dtype), new[keep].astype(dtype)
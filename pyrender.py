@@ -1,175 +1,453 @@
-import glfw
-from OpenGL.GL import *
-from OpenGL.GLU import *
+from __future__ import annotations
+
 import numpy as np
 import ctypes
+import importlib
+import os
 import sys
+from typing import TYPE_CHECKING, Tuple
 
 from numpy.typing import NDArray
 
+from export import STL_DTYPE, STL_HEADER_SIZE
+from mesh import decimate
+
+if TYPE_CHECKING:
+    from state import State
+
 gCamAngX = 0.0
 gCamAngY = -90.0
 gCamAngZ = 0.0
 gCamHeight = 3.0
-vertices = []
-normals = []
-faces = []
 dropped = 0
 modeFlag = 0
 distanceFromOrigin = 100
 
+OBJ_SEPARATOR, OBJ_DIGIT, OBJ_MINUS, OBJ_SLASH, OBJ_OTHER = range(5)
+OBJ_CHARACTERS = np.full(256, OBJ_OTHER, dtype=np.uint8)
+OBJ_CHARACTERS[np.frombuffer(b" \t\r\nf", dtype=np.uint8)] = OBJ_SEPARATOR
+OBJ_CHARACTERS[ord("0") : ord("9") + 1] = OBJ_DIGIT
+OBJ_CHARACTERS[ord("-")] = OBJ_MINUS
+OBJ_CHARACTERS[ord("/")] = OBJ_SLASH
+POWERS_OF_TEN = 10.0 ** np.arange(20)
+
 
 def dropCallback(window, paths):
-    global vertices, normals, faces, dropped, gVertexArraySeparate
-    numberOfFacesWith3Vertices = 0
-    numberOfFacesWith4Vertices = 0
-    numberOfFacesWithMoreThan4Vertices = 0
+    global dropped, gVertexArraySeparate, gScale
     dropped = 1
-    fileName = paths[0].split("\\")[-1]
-    if paths[0].split(".")[1].lower() != "obj":
-        print("Invalid File\nPlease provide an .obj file")
+    gScale = 1.0
+    fileName = os.path.basename(paths[0])
+    extension = os.path.splitext(paths[0])[1].lower()
+    if extension == ".stl":
+        gVertexArraySeparate = load_stl(paths[0])
+        print("File name:", fileName, "\nTotal number of faces:", len(gVertexArraySeparate) // 6)
         return
-    with open(paths[0]) as f:
-        lines = f.readlines()
-        vStrings = [x.strip("v") for x in lines if x.startswith("v ")]
-        vertices = convertVertices(vStrings)
-        if np.amax(vertices) <= 1.2:
-            vertices /= np.amax(vertices)
-        else:
-            vertices /= np.amax(vertices) / 2
-        vnStrings = [x.strip("vn") for x in lines if x.startswith("vn")]
-        if (
-            not vnStrings
-        ):  # if There is no normal vectors in the obj file then compute them
-            normals = fillNormalsArray(len(vStrings))
-        else:
-            normals = convertVertices(vnStrings)
-        faces = [x.strip("f") for x in lines if x.startswith("f")]
-    for face in faces:
-        if len(face.split()) == 3:
-            numberOfFacesWith3Vertices += 1
-        elif len(face.split()) == 4:
-            numberOfFacesWith4Vertices += 1
-        else:
-            numberOfFacesWithMoreThan4Vertices += 1
+    if extension != ".obj":
+        print("Invalid File\nPlease provide an .obj or .stl file")
+        return
+    gVertexArraySeparate, corners = load_obj(paths[0])
     print(
         "File name:",
         fileName,
         "\nTotal number of faces:",
-        len(faces),
+        len(corners),
         "\nNumber of faces with 3 vertices:",
-        numberOfFacesWith3Vertices,
+        np.count_nonzero(corners == 3),
         "\nNumber of faces with 4 vertices:",
-        numberOfFacesWith4Vertices,
+        np.count_nonzero(corners == 4),
         "\nNumber of faces with more than 4 vertices:",
-        numberOfFacesWithMoreThan4Vertices,
+        np.count_nonzero(corners > 4),
     )
-    if numberOfFacesWith4Vertices > 0 or numberOfFacesWithMoreThan4Vertices > 0:
-        faces = triangulate()
-    gVertexArraySeparate = createVertexArraySeparate()
-    ##########EMPTYING USELESS VARIABLES FOR MEMORY MANAGEMENT##########
-    faces = []
-    normals = []
-    vertices = []
-    ####################################################################
-
-
-def fillNormalsArray(numberOfVertices) -> NDArray:
-    normals = np.zeros((numberOfVertices, 3))
-    i = 0
-    for vertice in vertices:
-        normals[i] = normalized(vertice)
-        i += 1
-    return normals
-
-
-def convertVertices(verticesStrings) -> NDArray:
-    v = np.zeros((len(verticesStrings), 3))
-    i = 0
-    for vertice in verticesStrings:
-        j = 0
-        for t in vertice.split():
-            try:
-                v[i][j] = float(t)
-            except ValueError:
-                pass
-            j += 1
-        i += 1
-    return v
-
-
-def triangulate():
-    facesList = []
-    nPolygons = []
-    for face in faces:
-        if len(face.split()) >= 4:
-            nPolygons.append(face)
+
+
+def load_obj(path: str) -> Tuple[NDArray, NDArray]:
+    """
+    Parses v, vn and f records of obj file in bulk, polygons are fan
+    triangulated. Returns interleaved (normal, vertex) float32 rows, 6 per
+    triangle, and corner count of every face
+    """
+    with open(path, "rb") as f:
+        buffer = np.frombuffer(b"\n" + f.read() + b"\n", dtype=np.uint8)
+
+    # classify lines by their first two characters
+    heads = np.flatnonzero(buffer[:-1] == ord("\n")) + 1
+    first = buffer[heads]
+    second = buffer[np.minimum(heads + 1, len(buffer) - 1)]
+    blank = (second == ord(" ")) | (second == ord("\t"))
+    vertex_lines = (first == ord("v")) & blank
+    normal_lines = (first == ord("v")) & (second == ord("n"))
+    face_lines = (first == ord("f")) & blank
+    lengths = np.diff(np.append(heads, len(buffer)))
+
+    def lines(kind: NDArray) -> NDArray:
+        return buffer[np.concatenate(([False], np.repeat(kind, lengths)))]
+
+    vertices = fit(_obj_vectors(lines(vertex_lines), b"v", np.count_nonzero(vertex_lines)))
+    normals = _obj_vectors(lines(normal_lines), b"vn", np.count_nonzero(normal_lines))
+    if len(normals) == 0:
+        # no normal vectors in the obj file, point them away from origin
+        with np.errstate(divide="ignore", invalid="ignore"):
+            normals = vertices / np.linalg.norm(vertices, axis=1, keepdims=True)
+
+    fields, face = _obj_corners(lines(face_lines))
+    # negative indices count back from the records read so far
+    vertices_before = np.cumsum(vertex_lines)[face_lines][face]
+    normals_before = np.cumsum(normal_lines)[face_lines][face]
+    vertex = fields[:, 0]
+    vertex = np.where(vertex < 0, vertices_before + vertex, vertex - 1)
+    normal = fields[:, 2]
+    normal = np.where(normal < 0, normals_before + normal, normal - 1)
+    # v and v/vt corners reuse vertex index for the normal
+    normal = np.where(fields[:, 2] == 0, vertex, normal)
+
+    corners = np.bincount(face, minlength=np.count_nonzero(face_lines))
+    offsets = np.cumsum(corners) - corners
+    fans = np.maximum(corners - 2, 0)
+    owner = np.repeat(np.arange(len(corners)), fans)
+    step = np.arange(len(owner)) - np.repeat(np.cumsum(fans) - fans, fans) + 1
+    triangles = np.stack(
+        (offsets[owner], offsets[owner] + step, offsets[owner] + step + 1), axis=1
+    ).ravel()
+
+    varr = np.empty((len(triangles) * 2, 3), "float32")
+    varr[0::2] = normals[normal[triangles]]
+    varr[1::2] = vertices[vertex[triangles]]
+    return varr, corners
+
+
+def load_stl(path: str) -> NDArray:
+    """
+    Reads ascii or binary stl, returns interleaved (normal, vertex) float32
+    rows, 6 per triangle. Binary records are memory mapped, not parsed
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(STL_HEADER_SIZE + 4)
+    count = -1
+    if len(header) == STL_HEADER_SIZE + 4:
+        count = int(np.frombuffer(header, dtype="<u4", offset=STL_HEADER_SIZE)[0])
+    if size == STL_HEADER_SIZE + 4 + count * STL_DTYPE.itemsize:
+        records = np.zeros(0, STL_DTYPE)
+        if count:
+            records = np.memmap(
+                path, dtype=STL_DTYPE, mode="r", offset=STL_HEADER_SIZE + 4, shape=(count,)
+            )
+        normals, vertices = records["normal"], records["vertices"]
+    else:
+        normals, vertices = _ascii_stl(path)
+
+    return interleave(fit(vertices.reshape(-1, 3)).reshape(-1, 3, 3), normals)
+
+
+def interleave(vertices: NDArray, normals: NDArray) -> NDArray:
+    """
+    Render rows (normal, vertex) of (N,3,3) triangles, normals are (N,3) per
+    face or (N,3,3) per corner
+    """
+    varr = np.empty((len(vertices), 3, 2, 3), "float32")
+    varr[:, :, 0] = normals[:, None] if normals.ndim == 2 else normals
+    varr[:, :, 1] = vertices
+    return varr.reshape(-1, 3)
+
+
+def reduce_detail(varr: NDArray, target: int) -> NDArray:
+    """
+    Decimates render rows down to at most target triangles
+    """
+    triangles = varr.reshape(-1, 3, 2, 3)
+    vertices, normals = decimate(triangles[:, :, 1], triangles[:, 0, 0], target)
+    if len(vertices) == len(triangles):
+        return varr
+    print("Level of detail:", len(triangles), "->", len(vertices), "faces")
+    return interleave(vertices, normals)
+
+
+def fit(vertices: NDArray) -> NDArray:
+    """
+    Scales vertices into the view the same way for every format
+    """
+    return vertices / fit_divisor(vertices)
+
+
+def fit_divisor(vertices: NDArray) -> float:
+    top = float(np.amax(vertices)) if len(vertices) else 1.0
+    if top <= 0:
+        # nothing on the positive side to fit by
+        return 1.0
+    if top <= 1.2:
+        return top
+    return top / 2
+
+
+def mesh_arrays(
+    source: State | Tuple[NDArray, NDArray],
+) -> Tuple[NDArray, NDArray, NDArray | None]:
+    """
+    (N,3,3) vertices, (N,3) normals and mask of faces to draw or None for all,
+    for a State these are views of its buffers as export left them, pending
+    group transforms are baked but pruning is not run again
+    """
+    if isinstance(source, tuple):
+        vertices, normals = source
+        return np.asarray(vertices), np.asarray(normals), None
+    state = source
+    with state._lock:
+        state.apply_transforms()
+        enabled = ~state.disabled if state.disabled.any() else None
+        return state.vertices, state.normals, enabled
+
+
+def load_arrays(source: State | Tuple[NDArray, NDArray]):
+    """
+    Takes geometry from memory, scaling into the view is left to GL
+    """
+    global dropped, gArrays, gVertexArraySeparate, gScale
+    vertices, normals, enabled = mesh_arrays(source)
+    dropped = 1
+    gArrays = vertices, normals, enabled
+    gVertexArraySeparate = None
+    gScale = 1 / fit_divisor(vertices)
+    count = len(vertices) if enabled is None else np.count_nonzero(enabled)
+    print("Total number of faces:", count)
+
+
+def _ascii_stl(path: str) -> Tuple[NDArray, NDArray]:
+    with open(path, "rb") as f:
+        data = f.read()
+    # solid and endsolid lines may carry a name, only facets hold numbers
+    body = data[data.find(b"\n") + 1 : data.rfind(b"endsolid")]
+    for keyword in (b"endfacet", b"endloop", b"outer loop", b"facet normal", b"vertex"):
+        body = body.replace(keyword, b" ")
+    values = np.fromstring(body, sep=" ") if body.strip() else np.zeros(0)
+    if len(values) % 12:
+        raise Exception(f"{path} is not a valid stl file")
+    facets = values.reshape(-1, 12)
+    return facets[:, :3], facets[:, 3:].reshape(-1, 3, 3)
+
+
+def _obj_vectors(text: NDArray, keyword: bytes, count: int) -> NDArray:
+    """
+    First three coordinates of each v or vn line given as bytes
+    """
+    if count == 0:
+        return np.zeros((0, 3))
+    text = text.tobytes().replace(keyword, b" " * len(keyword))
+    values = np.fromstring(text, sep=" ")
+    if len(values) == 3 * count:
+        return values.reshape(-1, 3)
+    # optional w component somewhere, fall back to per line split
+    return np.array([line.split()[:3] for line in text.splitlines()], dtype=np.float64)
+
+
+def _obj_corners(text: NDArray) -> Tuple[NDArray, NDArray]:
+    """
+    Integer v/vt/vn fields of every corner of f lines given as bytes, 0 for
+    missing field, and index of face each corner belongs to
+    """
+    uniform = _obj_triangle_corners(text.tobytes())
+    if uniform is not None:
+        return uniform
+
+    kind = OBJ_CHARACTERS[text]
+    number = (kind == OBJ_DIGIT) | (kind == OBJ_MINUS)
+    edges = np.diff(number.view(np.int8), prepend=0, append=0)
+    field_starts = np.flatnonzero(edges == 1)
+    field_ends = np.flatnonzero(edges == -1)
+    token = (kind != OBJ_SEPARATOR).view(np.int8)
+    corner_starts = np.flatnonzero(np.diff(token, prepend=0) == 1)
+
+    # value of every field from its digits weighted by powers of ten
+    negative = kind[field_starts] == OBJ_MINUS
+    lengths = field_ends - field_starts - negative
+    field = np.repeat(np.arange(len(field_starts)), lengths)
+    positions = np.flatnonzero(kind == OBJ_DIGIT)
+    weights = (text[positions] - ord("0")) * POWERS_OF_TEN[field_ends[field] - positions - 1]
+    values = np.bincount(field, weights, minlength=len(field_starts)).astype(np.int64)
+    values[negative] *= -1
+
+    # slot of field is number of slashes since start of its corner
+    slashes = np.flatnonzero(kind == OBJ_SLASH)
+    corner = np.searchsorted(corner_starts, field_starts, side="right") - 1
+    slot = np.searchsorted(slashes, field_starts) - np.searchsorted(
+        slashes, corner_starts
+    )[corner]
+    fields = np.zeros((len(corner_starts), 3), dtype=np.int64)
+    keep = slot < 3
+    fields[corner[keep], slot[keep]] = values[keep]
+
+    face = np.searchsorted(np.flatnonzero(text == ord("\n")), corner_starts)
+    return fields, face
+
+
+def _obj_triangle_corners(text: bytes) -> Tuple[NDArray, NDArray] | None:
+    """
+    Fast path of _obj_corners for triangles sharing one index form, parsed
+    in a single pass, None when the file does not look like that
+    """
+    faces = text.count(b"\n")
+    head = text[: text.find(b"\n")].split()
+    if faces == 0 or len(head) < 2:
+        return None
+    slashes = head[1].count(b"/")
+    double = b"//" in head[1]
+    count = 3 * faces
+    if text.count(b"/") != slashes * count or text.count(b"//") != double * count:
+        return None
+    text = text.replace(b"f", b" ").replace(b"//", b"/0/").replace(b"/", b" ")
+    values = np.fromstring(text, dtype=np.int64, sep=" ")
+    if len(values) != (slashes + 1) * count:
+        return None
+
+    fields = np.zeros((count, 3), dtype=np.int64)
+    fields[:, : slashes + 1] = values.reshape(count, -1)
+    return fields, np.repeat(np.arange(faces), 3)
+
+
+def opengl(name: str = "GL"):
+    """
+    OpenGL.GL or OpenGL.GLU, imported on first use so loading and rendering
+    against a stand-in gl work without PyOpenGL or a display
+    """
+    return importlib.import_module(f"OpenGL.{name}")
+
+
+class VertexBuffer:
+    """
+    Interleaved (normal or color, vertex) float32 rows uploaded once into a
+    GL array buffer, gl is the OpenGL.GL module or a stand-in for it
+    """
+
+    def __init__(self, rows: NDArray, colors: bool = False, mode: int | None = None, gl=None):
+        gl = opengl() if gl is None else gl
+        rows = np.ascontiguousarray(rows, dtype=np.float32)
+        self.gl = gl
+        self.colors = colors
+        self.mode = gl.GL_TRIANGLES if mode is None else mode
+        self.count = len(rows) // 2
+        self.stride = 6 * rows.itemsize
+        self.id = array_buffer(rows, gl)
+
+    def draw(self):
+        gl = self.gl
+        attribute = gl.GL_COLOR_ARRAY if self.colors else gl.GL_NORMAL_ARRAY
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.id)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glEnableClientState(attribute)
+        if self.colors:
+            gl.glColorPointer(3, gl.GL_FLOAT, self.stride, ctypes.c_void_p(0))
         else:
-            facesList.append(face)
-    for face in nPolygons:
-        for i in range(1, len(face.split()) - 1):
-            seq = [str(face.split()[0]), str(face.split()[i]), str(face.split()[i + 1])]
-            string = " ".join(seq)
-            facesList.append(string)
-    return facesList
-
-
-def createVertexArraySeparate():
-    varr = np.zeros((len(faces) * 6, 3), "float32")
-    i = 0
-    normalsIndex = 0
-    verticeIndex = 0
-    for face in faces:
-        for f in face.split():
-            if "//" in f:  # f v//vn
-                verticeIndex = int(f.split("//")[0]) - 1
-                normalsIndex = int(f.split("//")[1]) - 1
-            elif "/" in f:
-                if len(f.split("/")) == 2:  # f v/vt
-                    verticeIndex = int(f.split("/")[0]) - 1
-                    normalsIndex = int(f.split("/")[0]) - 1
-                else:  # f v/vt/vn
-                    verticeIndex = int(f.split("/")[0]) - 1
-                    normalsIndex = int(f.split("/")[2]) - 1
-            else:  # f v v v
-                verticeIndex = int(f.split()[0]) - 1
-                normalsIndex = int(f.split()[0]) - 1
-            varr[i] = normals[normalsIndex]
-            varr[i + 1] = vertices[verticeIndex]
-            i += 2
-    return varr
-
-
-def render():
-    global gCamAng, gCamHeight, distanceFromOrigin, dropped, gEyeX, gEyeY, gEyeZ
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-
-    glEnable(GL_DEPTH_TEST)
-    glMatrixMode(
-        GL_PROJECTION
-    )  # use projection matrix stack for projection transformation for correct lighting
-    glLoadIdentity()
-    gluPerspective(distanceFromOrigin, 1, 1, 10)
-    glMatrixMode(GL_MODELVIEW)
-    glLoadIdentity()
-
-    # gluLookAt(gEyeX, gEyeY, gEyeZ, 0, 0, 0, 0, 0, 1)
-    gluLookAt(5 * np.sin(gCamAngX), 5 * np.sin(gCamAngY), 5 * np.cos(gCamAngX) + 5 * np.sin(gCamAngZ), 0.5, 0, 0, 0, 1, 0)
-
-    drawFrame()
-    glEnable(GL_LIGHTING)  # comment: no lighting
-    glEnable(GL_LIGHT0)
-    glEnable(GL_LIGHT1)
-    glEnable(GL_LIGHT2)
-    # light position
-    glPushMatrix()
-    lightPos0 = (1.0, 2.0, 3.0, 1.0)  # try to change 4th element to 0. or 1.
-    lightPos1 = (3.0, 2.0, 1.0, 1.0)
-    lightPos2 = (2.0, 3.0, 1.0, 1.0)
-    glLightfv(GL_LIGHT0, GL_POSITION, lightPos0)
-    glLightfv(GL_LIGHT1, GL_POSITION, lightPos1)
-    glLightfv(GL_LIGHT2, GL_POSITION, lightPos2)
-    glPopMatrix()
+            gl.glNormalPointer(gl.GL_FLOAT, self.stride, ctypes.c_void_p(0))
+        gl.glVertexPointer(3, gl.GL_FLOAT, self.stride, ctypes.c_void_p(self.stride // 2))
+        gl.glDrawArrays(self.mode, 0, self.count)
+        gl.glDisableClientState(attribute)
+        gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def delete(self):
+        self.gl.glDeleteBuffers(1, [self.id])
+
+
+class MeshBuffer:
+    """
+    Triangles in separate vertex and normal GL buffers, vertices are
+    uploaded straight from the (N,3,3) float32 or float64 array, with an
+    enabled mask only its runs of enabled faces are drawn
+    """
+
+    def __init__(
+        self,
+        vertices: NDArray,
+        normals: NDArray,
+        enabled: NDArray | None = None,
+        gl=None,
+    ):
+        gl = opengl() if gl is None else gl
+        if normals.ndim == 2:
+            # fixed pipeline wants a normal per corner
+            normals = np.repeat(normals, 3, axis=0)
+        self.gl = gl
+        self.count = 3 * len(vertices)
+        self.vertex_type = _gl_type(vertices, gl)
+        self.normal_type = _gl_type(normals, gl)
+        self.vertices = array_buffer(vertices, gl)
+        self.normals = array_buffer(normals, gl)
+        self.runs = None
+        if enabled is not None:
+            edges = np.diff(np.concatenate(([0], enabled.view(np.int8), [0])))
+            starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+            self.runs = (
+                (3 * starts).astype(np.int32),
+                (3 * (ends - starts)).astype(np.int32),
+            )
+
+    def draw(self):
+        gl = self.gl
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glEnableClientState(gl.GL_NORMAL_ARRAY)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vertices)
+        gl.glVertexPointer(3, self.vertex_type, 0, ctypes.c_void_p(0))
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.normals)
+        gl.glNormalPointer(self.normal_type, 0, ctypes.c_void_p(0))
+        if self.runs is None:
+            gl.glDrawArrays(gl.GL_TRIANGLES, 0, self.count)
+        elif len(self.runs[0]):
+            first, counts = self.runs
+            gl.glMultiDrawArrays(gl.GL_TRIANGLES, first, counts, len(first))
+        gl.glDisableClientState(gl.GL_NORMAL_ARRAY)
+        gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def delete(self):
+        self.gl.glDeleteBuffers(2, [self.vertices, self.normals])
+
+
+def array_buffer(array: NDArray, gl=None) -> int:
+    """
+    Uploads contiguous array into a new static GL array buffer, returns its id
+    """
+    gl = opengl() if gl is None else gl
+    array = np.ascontiguousarray(array)
+    buffer = gl.glGenBuffers(1)
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, buffer)
+    gl.glBufferData(gl.GL_ARRAY_BUFFER, array.nbytes, array, gl.GL_STATIC_DRAW)
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+    return buffer
+
+
+def _gl_type(array: NDArray, gl=None) -> int:
+    gl = opengl() if gl is None else gl
+    if array.dtype == np.float32:
+        return gl.GL_FLOAT
+    if array.dtype == np.float64:
+        return gl.GL_DOUBLE
+    raise Exception(f"can not draw {array.dtype} arrays")
+
+
+# (color, vertex) rows of the x, y and z axis lines
+FRAME = np.array(
+    [
+        [[1, 0, 0], [0, 0, 0]],
+        [[1, 0, 0], [1, 0, 0]],
+        [[0, 1, 0], [0, 0, 0]],
+        [[0, 1, 0], [0, 1, 0]],
+        [[0, 0, 1], [0, 0, 0]],
+        [[0, 0, 1], [0, 0, 1]],
+    ],
+    dtype=np.float32,
+).reshape(-1, 3)
+
+
+def setup_lighting(gl=None):
+    """
+    Light colors and material, set once per context
+    """
+    gl = opengl() if gl is None else gl
+    gl.glEnable(gl.GL_DEPTH_TEST)
+    # meshes handed over in memory are scaled on the gpu, keep normals unit
+    gl.glEnable(gl.GL_NORMALIZE)
+    gl.glEnable(gl.GL_LIGHT0)
+    gl.glEnable(gl.GL_LIGHT1)
+    gl.glEnable(gl.GL_LIGHT2)
 
     # light intensity for each color channel
     ambientLightColor0 = (0.1, 0.1, 0.1, 1.0)
@@ -181,62 +459,86 @@ def render():
     ambientLightColor2 = (0.05, 0.05, 0.05, 1.0)
     diffuseLightColor2 = (0.5, 0.5, 0.0, 0.5)
     specularLightColor2 = (0.5, 0.5, 0.0, 0.5)
-    glLightfv(GL_LIGHT0, GL_AMBIENT, ambientLightColor0)
-    glLightfv(GL_LIGHT0, GL_DIFFUSE, diffuseLightColor0)
-    glLightfv(GL_LIGHT0, GL_SPECULAR, specularLightColor0)
-    glLightfv(GL_LIGHT1, GL_AMBIENT, ambientLightColor1)
-    glLightfv(GL_LIGHT1, GL_DIFFUSE, diffuseLightColor1)
-    glLightfv(GL_LIGHT1, GL_SPECULAR, specularLightColor1)
-    glLightfv(GL_LIGHT2, GL_AMBIENT, ambientLightColor2)
-    glLightfv(GL_LIGHT2, GL_DIFFUSE, diffuseLightColor2)
-    glLightfv(GL_LIGHT2, GL_SPECULAR, specularLightColor2)
+    gl.glLightfv(gl.GL_LIGHT0, gl.GL_AMBIENT, ambientLightColor0)
+    gl.glLightfv(gl.GL_LIGHT0, gl.GL_DIFFUSE, diffuseLightColor0)
+    gl.glLightfv(gl.GL_LIGHT0, gl.GL_SPECULAR, specularLightColor0)
+    gl.glLightfv(gl.GL_LIGHT1, gl.GL_AMBIENT, ambientLightColor1)
+    gl.glLightfv(gl.GL_LIGHT1, gl.GL_DIFFUSE, diffuseLightColor1)
+    gl.glLightfv(gl.GL_LIGHT1, gl.GL_SPECULAR, specularLightColor1)
+    gl.glLightfv(gl.GL_LIGHT2, gl.GL_AMBIENT, ambientLightColor2)
+    gl.glLightfv(gl.GL_LIGHT2, gl.GL_DIFFUSE, diffuseLightColor2)
+    gl.glLightfv(gl.GL_LIGHT2, gl.GL_SPECULAR, specularLightColor2)
     # material reflectance for each color channel
     diffuseObjectColor = (0.4, 0.6, 0.5, 1.0)
     specularObjectColor = (0.6, 0.3, 0.3, 0.5)
-    glMaterialfv(GL_FRONT, GL_AMBIENT_AND_DIFFUSE, diffuseObjectColor)
-    # glMaterialfv(GL_FRONT, GL_SPECULAR, specularObjectColor)
-
-    glPushMatrix()
-    if dropped == 1:
-        draw_glDrawArray()
-    glPopMatrix()
-
-    glDisable(GL_LIGHTING)
-
-
-def draw_glDrawArray():
-    global gVertexArraySeparate
-    varr = gVertexArraySeparate
-    glEnableClientState(GL_VERTEX_ARRAY)
-    glEnableClientState(GL_NORMAL_ARRAY)
-    glNormalPointer(GL_FLOAT, 6 * varr.itemsize, varr)
-    glVertexPointer(
-        3,
-        GL_FLOAT,
-        6 * varr.itemsize,
-        ctypes.c_void_p(varr.ctypes.data + 3 * varr.itemsize),
-    )
-    glDrawArrays(GL_TRIANGLES, 0, int(varr.size / 6))
+    gl.glMaterialfv(gl.GL_FRONT, gl.GL_AMBIENT_AND_DIFFUSE, diffuseObjectColor)
+    # gl.glMaterialfv(gl.GL_FRONT, gl.GL_SPECULAR, specularObjectColor)
+
+
+def upload(gl=None):
+    """
+    Moves freshly loaded geometry into vertex buffers, client copy is dropped
+    """
+    global gVertexArraySeparate, gArrays, gMesh, gFrame
+    gl = opengl() if gl is None else gl
+    if gFrame is None:
+        gFrame = VertexBuffer(FRAME, colors=True, mode=gl.GL_LINES, gl=gl)
+    if gVertexArraySeparate is None and gArrays is None:
+        return
+    if gMesh is not None:
+        gMesh.delete()
+    if gArrays is not None:
+        gMesh = MeshBuffer(*gArrays, gl=gl)
+    else:
+        gMesh = VertexBuffer(gVertexArraySeparate, gl=gl)
+    gVertexArraySeparate = gArrays = None
+
+
+def render(gl=None, glu=None):
+    gl = opengl() if gl is None else gl
+    glu = opengl("GLU") if glu is None else glu
+    upload(gl)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+
+    gl.glMatrixMode(
+        gl.GL_PROJECTION
+    )  # use projection matrix stack for projection transformation for correct lighting
+    gl.glLoadIdentity()
+    glu.gluPerspective(distanceFromOrigin, 1, 1, 10)
+    gl.glMatrixMode(gl.GL_MODELVIEW)
+    gl.glLoadIdentity()
+
+    glu.gluLookAt(5 * np.sin(gCamAngX), 5 * np.sin(gCamAngY), 5 * np.cos(gCamAngX) + 5 * np.sin(gCamAngZ), 0.5, 0, 0, 0, 1, 0)
+
+    gFrame.draw()
+    gl.glEnable(gl.GL_LIGHTING)  # comment: no lighting
+    # light position, follows the camera so it is set every frame
+    gl.glPushMatrix()
+    lightPos0 = (1.0, 2.0, 3.0, 1.0)  # try to change 4th element to 0. or 1.
+    lightPos1 = (3.0, 2.0, 1.0, 1.0)
+    lightPos2 = (2.0, 3.0, 1.0, 1.0)
+    gl.glLightfv(gl.GL_LIGHT0, gl.GL_POSITION, lightPos0)
+    gl.glLightfv(gl.GL_LIGHT1, gl.GL_POSITION, lightPos1)
+    gl.glLightfv(gl.GL_LIGHT2, gl.GL_POSITION, lightPos2)
+    gl.glPopMatrix()
 
+    gl.glPushMatrix()
+    if dropped == 1 and gMesh is not None:
+        gl.glScalef(gScale, gScale, gScale)
+        gMesh.draw()
+    gl.glPopMatrix()
 
-def drawFrame():
-    glBegin(GL_LINES)
-    glColor3ub(255, 0, 0)
-    glVertex3fv(np.array([0.0, 0.0, 0.0]))
-    glVertex3fv(np.array([1.0, 0.0, 0.0]))
-    glColor3ub(0, 255, 0)
-    glVertex3fv(np.array([0.0, 0.0, 0.0]))
-    glVertex3fv(np.array([0.0, 1.0, 0.0]))
-    glColor3ub(0, 0, 255)
-    glVertex3fv(np.array([0.0, 0.0, 0]))
-    glVertex3fv(np.array([0.0, 0.0, 1.0]))
-    glEnd()
+    gl.glDisable(gl.GL_LIGHTING)
 
 
 def key_callback(window, key, scancode, action, mods):
-    global gCamAng, gCamHeight, modeFlag, distanceFromOrigin, gCamAngX, gCamAngY, gCamAngZ 
+    global gCamAng, gCamHeight, modeFlag, distanceFromOrigin, gCamAngX, gCamAngY, gCamAngZ, gDirty
+    import glfw
+
+    gl = opengl()
     rotate_step = 2
     if action == glfw.PRESS or action == glfw.REPEAT:
+        gDirty = True
         if key == glfw.KEY_H:
             gCamAngX += np.radians(-rotate_step % 360)
         elif key == glfw.KEY_L:
@@ -251,10 +553,10 @@ def key_callback(window, key, scancode, action, mods):
             gCamAngZ += np.radians(rotate_step % 360)
         elif key == glfw.KEY_Z:
             if modeFlag == 0:
-                glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
+                gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_LINE)
                 modeFlag = 1
             else:
-                glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+                gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_FILL)
                 modeFlag = 0
         elif key == glfw.KEY_A:
             if distanceFromOrigin > 0:
@@ -267,14 +569,25 @@ def key_callback(window, key, scancode, action, mods):
             gCamHeight = 1.0
             distanceFromOrigin = 45
         elif key == glfw.KEY_Q:
-            glfw.set_window_should_close(window, GL_TRUE)
+            glfw.set_window_should_close(window, gl.GL_TRUE)
 
 
-gVertexArraySeparate = np.zeros((3, 3))
+gVertexArraySeparate: NDArray | None = None
+gArrays: Tuple[NDArray, NDArray, NDArray | None] | None = None
+gScale = 1.0
+gMesh: VertexBuffer | MeshBuffer | None = None
+gFrame: VertexBuffer | None = None
+gDirty = True
 
 
-def start(filename: str):
-    global gVertexArraySeparate
+def start(source: str | State | Tuple[NDArray, NDArray], lod: int | None = None):
+    """
+    Opens viewer window on obj or stl file, State or (vertices, normals)
+    arrays, lod caps the triangles drawn
+    """
+    global gDirty, gMesh, gFrame, gVertexArraySeparate, gArrays
+    import glfw
+
     if not glfw.init():
         return
     window = glfw.create_window(640, 640, "3D Obj File Viewer", None, None)
@@ -284,30 +597,42 @@ def start(filename: str):
     glfw.make_context_current(window)
     glfw.set_key_callback(window, key_callback)
     glfw.set_framebuffer_size_callback(window, framebuffer_size_callback)
+    glfw.set_window_refresh_callback(window, refresh_callback)
     glfw.swap_interval(1)
 
-    count = 0
-    dropCallback(window, [filename])
+    setup_lighting()
+    if isinstance(source, str):
+        dropCallback(window, [source])
+    else:
+        load_arrays(source)
+    if lod is not None and gVertexArraySeparate is not None:
+        gVertexArraySeparate = reduce_detail(gVertexArraySeparate, lod)
+    if lod is not None and gArrays is not None:
+        vertices, normals, enabled = gArrays
+        if enabled is not None:
+            vertices, normals = vertices[enabled], normals[enabled]
+        gArrays = (*decimate(vertices, normals, lod), None)
+    gDirty = True
     while not glfw.window_should_close(window):
-        glfw.poll_events()
-        count += 1
-        render()
-        count += 1
-        glfw.swap_buffers(window)
+        # redraw only after input or expose, sleep until the next event
+        if gDirty:
+            gDirty = False
+            render()
+            glfw.swap_buffers(window)
+        glfw.wait_events()
+    gMesh = gFrame = None
     glfw.terminate()
 
 
-def l2norm(v):
-    return np.sqrt(np.dot(v, v))
-
-
-def normalized(v):
-    l = l2norm(v)
-    return 1 / l * np.array(v)
+def framebuffer_size_callback(window, width, height):
+    global gDirty
+    opengl().glViewport(0, 0, width, height)
+    gDirty = True
 
 
-def framebuffer_size_callback(window, width, height):
-    glViewport(0, 0, width, height)
+def refresh_callback(window):
+    global gDirty
+    gDirty = True
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Tuple
+import numpy as np
+from numpy.typing import NDArray
+
+if TYPE_CHECKING:
+    from state import State
+
+AXES = {"x": 0, "y": 1, "z": 2}
+
+
+def translation(x: float, y: float, z: float) -> NDArray:
+    matrix = np.eye(4)
+    matrix[:3, 3] = (x, y, z)
+    return matrix
+
+
+def rotation(angle: float, axis: str = "z") -> NDArray:
+    """
+    Counter clockwise rotation by angle in degrees around axis through origin
+    """
+    first, second = [i for i in range(3) if i != AXES[axis]]
+    if axis == "y":
+        first, second = second, first
+    cos, sin = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    matrix = np.eye(4)
+    matrix[first, first] = cos
+    matrix[first, second] = -sin
+    matrix[second, first] = sin
+    matrix[second, second] = cos
+    return matrix
+
+
+def scaling(x: float, y: float, z: float) -> NDArray:
+    return np.diag([x, y, z, 1.0])
+
+
+def mirroring(axis: str) -> NDArray:
+    matrix = np.eye(4)
+    matrix[AXES[axis], AXES[axis]] = -1
+    return matrix
+
+
+def transform(
+    vertices: NDArray, normals: NDArray, matrices: NDArray
+) -> Tuple[NDArray, NDArray]:
+    """
+    Applies (N,4,4) matrices to (N,3,3) vertices and (N,3) normals in one
+    batched multiply, mirroring matrices also flip winding to keep faces
+    facing out
+    """
+    linear = matrices[:, :3, :3]
+    vertices = np.einsum("nij,nkj->nki", linear, vertices) + matrices[:, None, :3, 3]
+
+    normals = np.einsum("nji,nj->ni", np.linalg.inv(linear), normals)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+    flipped = np.linalg.det(linear) < 0
+    vertices[flipped] = vertices[flipped][:, [0, 2, 1]]
+    return vertices, normals
+
+
+class Group:
+    """
+    Scene graph node, faces created while the group is entered belong to it
+    Transforms are only recorded, State applies them when exporting, every
+    call composes after the previous ones and array repeats everything so far
+    """
+
+    state: State
+    index: int
+    parent: Group | None
+    matrices: NDArray
+
+    def __init__(self, state: State, index: int, parent: Group | None):
+        self.state = state
+        self.index = index
+        self.parent = parent
+        self.matrices = np.eye(4)[None]
+
+    def __enter__(self) -> Group:
+        self.state.enter_group(self)
+        return self
+
+    def __exit__(self, *_):
+        self.state.exit_group(self)
+
+    def __repr__(self):
+        return f"Group #{self.index} ({len(self.matrices)} instances)"
+
+    def apply(self, matrix: NDArray) -> Group:
+        self.matrices = matrix @ self.matrices
+        return self
+
+    def translate(self, x: float, y: float, z: float) -> Group:
+        return self.apply(translation(x, y, z))
+
+    def rotate(self, angle: float, axis: str = "z") -> Group:
+        return self.apply(rotation(angle, axis))
+
+    def scale(self, x: float, y: float | None = None, z: float | None = None) -> Group:
+        return self.apply(scaling(x, x if y is None else y, x if z is None else z))
+
+    def mirror(self, axis: str) -> Group:
+        return self.apply(mirroring(axis))
+
+    def array(self, count: int, x: float, y: float, z: float) -> Group:
+        """
+        Repeats group count times, each copy shifted by (x, y, z) from previous
+        """
+        steps = np.stack([translation(i * x, i * y, i * z) for i in range(count)])
+        self.matrices = (steps[:, None] @ self.matrices[None]).reshape(-1, 4, 4)
+        return self
+
+    def world_matrices(self) -> NDArray:
+        """
+        (K,4,4) matrices of every instance including transforms of parents
+        """
+        if self.parent is None:
+            return self.matrices
+        parent = self.parent.world_matrices()
+        return (parent[:, None] @ self.matrices[None]).reshape(-1, 4, 4)
+
+    def reset(self):
+        self.matrices = np.eye(4)[None]
@@ -1,8 +1,33 @@
 from __future__ import annotations
 
-from typing import List, Set, Tuple
+from collections import OrderedDict
+from contextlib import nullcontext
+from functools import lru_cache
+from threading import Lock, RLock
+import time
+from typing import BinaryIO, Callable, Hashable, Iterator, List, Set, TextIO, Tuple
 from textwrap import indent
 import numpy as np
+from numpy.typing import ArrayLike, NDArray
+
+from export import (
+    STL_BATCH_SIZE,
+    iter_ascii_stl,
+    write_ascii_stl_parallel,
+    write_binary_stl,
+    write_obj,
+)
+from cache import GeometryCache, cached_primitive, iter_cached_ascii_stl
+from scene import Group, transform
+from timing import Profiler
+from mesh import (
+    coplanar_rectangles,
+    duplicate_faces,
+    duplicate_walls,
+    face_normals,
+    hidden_walls,
+    weld,
+)
 
 INDENT_TAB = " " * 4
 
@@ -13,23 +38,31 @@ BOTTOM = (0, 0, -1)
 LEFT = (-1, 0, 0)
 RIGHT = (1, 0, 0)
 
-PERFORMANCE = True
+PRUNE_DUPLICATES = True
+
+INITIAL_CAPACITY = 64
+
+GRID_BLOCK_CELLS = 1 << 18
+
+CUBOID_BATCH_SIZE = 1 << 15
+
+NORMALS_BATCH_SIZE = 1 << 20
+
+# below this many faces starting a process pool costs more than formatting
+PARALLEL_MIN_FACES = 1 << 17
 
 
 class Point:
     x: float
     y: float
     z: float
-    index: int = 1
+    index: int
 
-    used: int = 0
-
-    def __init__(self, x: float, y: float, z: float):
+    def __init__(self, x: float, y: float, z: float, index: int = 0):
         self.x = x
         self.y = y
         self.z = z
-        Point.used += 1
-        self.index = Point.used
+        self.index = index
 
     def __repr__(self):
         return f"#{self.index} ({self.x}, {self.y}, {self.z})"
@@ -39,38 +72,72 @@ class Point:
 
 
 class Wall:
-    faces: List[Face]
-    disabled: bool
+    """
+    View of two faces of a State forming one rectangular wall
+    """
+
+    __slots__ = ("state", "index")
+
+    state: State
+    index: int
 
-    def __init__(self, faces):
-        self.faces = faces
-        self.disabled = False
+    def __init__(self, state: State, index: int):
+        self.state = state
+        self.index = index
 
     def __repr__(self):
         return f"#{self.faces}"
 
+    @property
+    def faces(self) -> List[Face]:
+        return [Face(self.state, int(i)) for i in self.state.wall_faces[self.index]]
+
+    @property
+    def disabled(self) -> bool:
+        return bool(self.state.disabled[self.state.wall_faces[self.index]].all())
+
     def disable(self):
-        self.disabled = True
-        for face in self.faces:
-            face.disabled = True
+        self.state.disabled[self.state.wall_faces[self.index]] = True
 
     def get_point_set(self) -> Set[Tuple[float]]:
         s = set()
         for face in self.faces:
-            for point in face.points:
-                s.add((point.x, point.y, point.z))
+            s |= face.get_point_set()
         return s
 
 
 class Face:
-    points: List[Point]
-    normal: Point
-    disabled: bool
+    """
+    View of a single triangle stored in State buffers
+    """
+
+    __slots__ = ("state", "index")
+
+    state: State
+    index: int
+
+    def __init__(self, state: State, index: int):
+        self.state = state
+        self.index = index
+
+    @property
+    def points(self) -> List[Point]:
+        return [
+            Point(*map(float, v), index=3 * self.index + k + 1)
+            for k, v in enumerate(self.state.vertices[self.index])
+        ]
 
-    def __init__(self, points: List[Point], normal: Point):
-        self.points = points
-        self.normal = normal
-        self.disabled = False
+    @property
+    def normal(self) -> Point:
+        return Point(*map(float, self.state.normals[self.index]))
+
+    @property
+    def disabled(self) -> bool:
+        return bool(self.state.disabled[self.index])
+
+    @disabled.setter
+    def disabled(self, value: bool):
+        self.state.disabled[self.index] = value
 
     def get_point_set(self) -> Set[Tuple[float]]:
         s = set()
@@ -100,48 +167,467 @@ def faces_str(faces: List[Face]) -> str:
     return result
 
 
+def _grown(buffer: NDArray, size: int) -> NDArray:
+    """
+    Returns buffer with capacity for at least size rows, doubling when it grows
+    """
+    if size <= len(buffer):
+        return buffer
+    result = np.zeros((max(size, 2 * len(buffer)), *buffer.shape[1:]), buffer.dtype)
+    result[: len(buffer)] = buffer
+    return result
+
+
+class Template:
+    """
+    Geometry of a primitive placed at origin, walls index its own faces
+    """
+
+    vertices: NDArray
+    normals: NDArray
+    walls: NDArray
+
+    def __init__(self, state: State):
+        self.vertices = state.vertices.copy()
+        self.normals = state.normals.copy()
+        self.walls = state.wall_faces.copy()
+        # shared between States and threads, so never modified in place
+        for array in (self.vertices, self.normals, self.walls):
+            array.flags.writeable = False
+
+
+class TemplateCache:
+    """
+    Memoized primitive templates, least recently used ones are evicted once
+    there are more than maxsize (None keeps all)
+    """
+
+    maxsize: int | None
+    templates: OrderedDict[Hashable, Template]
+
+    def __init__(self, maxsize: int | None = None):
+        self.maxsize = maxsize
+        self.templates = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self.templates)
+
+    def get(self, key: Hashable, build: Callable[[], Template]) -> Template:
+        with self._lock:
+            template = self.templates.get(key)
+            if template is None:
+                template = build()
+                self.templates[key] = template
+                if self.maxsize is not None and len(self.templates) > self.maxsize:
+                    self.templates.popitem(last=False)
+            else:
+                self.templates.move_to_end(key)
+            return template
+
+
+@lru_cache(maxsize=None)
+def cuboid_basis(gap_axes: Tuple[bool, bool, bool]) -> Tuple[Template, NDArray]:
+    """
+    Cuboid geometry is linear in its sizes and gaps, for cuboids with gaps on
+    gap_axes returns template of unit sizes without gaps and coefficients of
+    the gaps, so vertices = position + sizes * template + gaps * coefficients
+    """
+    gaps = [0 if axis else None for axis in gap_axes]
+    sizes = State(dtype=np.float64)._cuboid_geometry(0, 0, 0, 1, 1, 1, *gaps)
+    gaps = [1 if axis else None for axis in gap_axes]
+    coefficients = State(dtype=np.float64)._cuboid_geometry(0, 0, 0, 0, 0, 0, *gaps)
+    return Template(sizes), coefficients.vertices.copy()
+
+
 class State:
-    faces: List[Face]
-    walls: List[Wall]
+    """
+    Triangle mesh kept in growable numpy buffers
+
+    vertices is (N,3,3) float32, normals (N,3) float32 and disabled (N,) bool,
+    walls are pairs of face indices created by cuboid sides
+    Vertices are indexed per State and appends and exports hold a per State
+    lock, so States can be built and exported from concurrent threads
+    """
+
+    face_count: int
+    wall_count: int
     stl_str: str
     name: str
-
-    def __init__(self, name="test"):
-        self.faces = []
-        self.walls = []
+    simplify: bool
+    recompute_normals: bool
+    templates: TemplateCache
+    groups: List[Group]
+    cache: GeometryCache | None
+    segments: List[Tuple[int, int, str]]
+    profiler: Profiler | None
+
+    def __init__(
+        self,
+        name="test",
+        simplify=False,
+        recompute_normals=False,
+        template_cache_size: int | None = None,
+        dtype=np.float32,
+        cache: GeometryCache | None = None,
+        profiler: Profiler | None = None,
+    ):
+        self._vertices = np.zeros((INITIAL_CAPACITY, 3, 3), dtype)
+        self._normals = np.zeros((INITIAL_CAPACITY, 3), dtype)
+        self._disabled = np.zeros(INITIAL_CAPACITY, bool)
+        self._walls = np.zeros((INITIAL_CAPACITY, 2), np.int64)
+        self._group_ids = np.zeros(INITIAL_CAPACITY, np.int64)
+        self.groups = []
+        self._group_stack = []
+        self.face_count = 0
+        self.wall_count = 0
+        self._lock = RLock()
         self.stl_str = ""
         self.name = name
+        self.simplify = simplify
+        self.recompute_normals = recompute_normals
+        self.templates = TemplateCache(template_cache_size)
+        self.cache = cache
+        self.segments = []
+        self._cache_depth = 0
+        self.profiler = profiler
+
+    @property
+    def vertices(self) -> NDArray:
+        return self._vertices[: self.face_count]
+
+    @property
+    def normals(self) -> NDArray:
+        return self._normals[: self.face_count]
+
+    @property
+    def disabled(self) -> NDArray:
+        return self._disabled[: self.face_count]
+
+    @property
+    def wall_faces(self) -> NDArray:
+        return self._walls[: self.wall_count]
+
+    @property
+    def group_ids(self) -> NDArray:
+        return self._group_ids[: self.face_count]
+
+    @property
+    def faces(self) -> List[Face]:
+        return [Face(self, i) for i in range(self.face_count)]
+
+    @property
+    def walls(self) -> List[Wall]:
+        return [Wall(self, i) for i in range(self.wall_count)]
+
+    def append_faces(self, vertices: ArrayLike, normals: ArrayLike) -> int:
+        """
+        Appends (N,3,3) vertices with (N,3) or single (3,) normals,
+        returns index of first appended face
+        """
+        vertices = np.asarray(vertices).reshape(-1, 3, 3)
+        normals = np.asarray(normals).reshape(-1, 3)
+        with self._lock:
+            start = self.face_count
+            end = start + len(vertices)
+
+            self._vertices = _grown(self._vertices, end)
+            self._normals = _grown(self._normals, end)
+            self._disabled = _grown(self._disabled, end)
+            self._group_ids = _grown(self._group_ids, end)
+
+            self._vertices[start:end] = vertices
+            self._normals[start:end] = normals
+            self._disabled[start:end] = False
+            self._group_ids[start:end] = (
+                self._group_stack[-1].index if self._group_stack else 0
+            )
+            self.face_count = end
+            return start
+
+    def append_walls(self, walls: ArrayLike) -> State:
+        """
+        Appends (N,2) pairs of face indices as walls
+        """
+        walls = np.asarray(walls, np.int64).reshape(-1, 2)
+        with self._lock:
+            end = self.wall_count + len(walls)
+            self._walls = _grown(self._walls, end)
+            self._walls[self.wall_count : end] = walls
+            self.wall_count = end
+        return self
+
+    def group(self) -> Group:
+        """
+        New scene graph group nested in the current one, use as context
+        manager, faces created inside it get its transforms at export
+
+            with state.group() as tower:
+                state.box(0, 0, 0, 10)
+            tower.rotate(45).array(4, 20, 0, 0)
+        """
+        parent = self._group_stack[-1] if self._group_stack else None
+        group = Group(self, len(self.groups) + 1, parent)
+        self.groups.append(group)
+        return group
+
+    def enter_group(self, group: Group):
+        self._group_stack.append(group)
+
+    def exit_group(self, group: Group):
+        if not self._group_stack or self._group_stack[-1] is not group:
+            raise Exception("Groups need to be exited in reverse order of entering")
+        self._group_stack.pop()
+
+    def apply_transforms(self):
+        """
+        Bakes recorded group transforms into faces with one batched matrix
+        multiply, extra instances of array patterns are appended along with
+        their walls, groups are reset to identity afterwards
+        """
+        with self._lock:
+            if not self.groups or self.face_count == 0:
+                return
+            world = [np.eye(4)[None]] + [g.world_matrices() for g in self.groups]
+            counts = np.array([len(matrices) for matrices in world])
+            first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            matrices = np.concatenate(world)
+
+            ids = self.group_ids.copy()
+            extra = counts[ids] - 1
+            source = np.concatenate(
+                (np.flatnonzero(ids), np.repeat(np.arange(len(ids)), extra))
+            )
+            offsets = np.cumsum(extra) - extra
+            instance = np.concatenate(
+                (
+                    np.zeros(np.count_nonzero(ids), np.int64),
+                    np.arange(extra.sum()) - np.repeat(offsets, extra) + 1,
+                )
+            )
+            vertices, normals = transform(
+                self.vertices[source].astype(np.float64),
+                self.normals[source].astype(np.float64),
+                matrices[first[ids[source]] + instance],
+            )
+
+            moved = np.count_nonzero(ids)
+            self.vertices[source[:moved]] = vertices[:moved]
+            self.normals[source[:moved]] = normals[:moved]
+            disabled = self.disabled[source[moved:]]
+            start = self.append_faces(vertices[moved:], normals[moved:])
+            self.disabled[start:] = disabled
+
+            # copy k of face f lands at start + sum(extra[:f]) + k - 1
+            walls = self.wall_faces[extra[self.wall_faces[:, 0]] > 0]
+            copies = extra[walls[:, 0]]
+            k = np.arange(copies.sum()) - np.repeat(np.cumsum(copies) - copies, copies)
+            walls = np.repeat(walls, copies, axis=0)
+            self.append_walls(start + offsets[walls] + k[:, None])
+
+            self.group_ids[:] = 0
+            for group in self.groups:
+                group.reset()
+
+    def stage(self, name: str):
+        """
+        Context timing a pipeline stage when a profiler is attached
+        """
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.stage(name, self)
+
+    def prepare_export(self):
+        """
+        Runs the passes enabled for export: transforms, pruning, merging, normals
+        """
+        with self._lock:
+            with self.stage("transforms"):
+                self.apply_transforms()
+            if PRUNE_DUPLICATES:
+                with self.stage("prune walls"):
+                    self.prune_duplicate_walls()
+                with self.stage("prune faces"):
+                    self.prune_duplicate_faces()
+                with self.stage("hidden walls"):
+                    self.remove_hidden_walls()
+            if self.simplify:
+                with self.stage("simplify"):
+                    self.merge_coplanar_faces()
+            if self.recompute_normals:
+                with self.stage("normals"):
+                    self.update_normals()
+
+    def enabled_faces(self) -> Tuple[NDArray, NDArray]:
+        """
+        Prepares export and returns vertices and normals of faces that are
+        not disabled
+        """
+        with self._lock:
+            self.prepare_export()
+            enabled = ~self.disabled
+            return self.vertices[enabled], self.normals[enabled]
+
+    def iter_stl_chunks(self, batch_size: int = STL_BATCH_SIZE) -> Iterator[str]:
+        """
+        Yields ascii stl text formatted batch_size facets at a time
+        """
+        with self._lock:
+            self.prepare_export()
+            # views stay valid when other threads append, as growing the
+            # buffers allocates new ones
+            if self.cache is not None:
+                return iter_cached_ascii_stl(
+                    self.cache,
+                    self.name,
+                    self.vertices,
+                    self.normals,
+                    ~self.disabled,
+                    list(self.segments),
+                    batch_size,
+                )
+            return iter_ascii_stl(
+                self.name, self.vertices, self.normals, ~self.disabled, batch_size
+            )
+
+    def write_stl(
+        self, f: TextIO, batch_size: int = STL_BATCH_SIZE, workers: int | None = 1
+    ):
+        """
+        Streams ascii stl into f without holding the whole text in memory,
+        with workers other than 1 large meshes are formatted in a process pool
+        (None uses every core)
+        """
+        if (
+            workers != 1
+            and self.cache is None
+            and (~self.disabled).sum() >= PARALLEL_MIN_FACES
+        ):
+            vertices, normals = self.enabled_faces()
+            write_ascii_stl_parallel(
+                f, self.name, vertices, normals, workers, batch_size
+            )
+            return
+        if self.profiler is None:
+            for chunk in self.iter_stl_chunks(batch_size):
+                f.write(chunk)
+            return
+
+        chunks = self.iter_stl_chunks(batch_size)
+        formatting = writing = 0.0
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            formatting += time.perf_counter() - start
+            if chunk is None:
+                break
+            start = time.perf_counter()
+            f.write(chunk)
+            writing += time.perf_counter() - start
+        faces = int((~self.disabled).sum())
+        self.profiler.record("format", formatting, faces)
+        self.profiler.record("write", writing, faces)
+
+    def place(self, template: Template, x: float, y: float, z: float) -> State:
+        """
+        Appends template geometry translated by (x, y, z)
+        """
+        start = self.append_faces(template.vertices + (x, y, z), template.normals)
+        self.append_walls(template.walls + start)
+        return self
 
     def update_str_state(self):
-        if not PERFORMANCE:
-            self.prune_duplicate_walls()
-            self.prune_duplicate_faces()
-        self.stl_str = f"solid {self.name}\n"
-        self.stl_str += indent(faces_str(self.faces), INDENT_TAB)
-        self.stl_str += "endsolid"
+        self.stl_str = "".join(self.iter_stl_chunks())
+
+    def indexed_mesh(self) -> Tuple[NDArray, NDArray, NDArray, NDArray]:
+        """
+        Welds enabled faces into shared tables, returns points (V,3),
+        normals (K,3), faces (F,3) indexing points and face normals (F,)
+        indexing normals
+        """
+        vertices, normals = self.enabled_faces()
+        points, faces = weld(vertices)
+        normals, face_normals = weld(normals)
+        return points, normals, faces, face_normals
+
+    def write_obj(self, f: TextIO):
+        write_obj(f, *self.indexed_mesh(), self.name)
+
+    def write_binary_stl(self, f: BinaryIO):
+        vertices, normals = self.enabled_faces()
+        write_binary_stl(f, vertices, normals, self.name)
+
+    def update_normals(self):
+        """
+        Replaces normals with unit normals of each face plane, primitives do
+        not wind consistently so the side stored normals point to is kept
+        """
+        for start in range(0, self.face_count, NORMALS_BATCH_SIZE):
+            end = start + NORMALS_BATCH_SIZE
+            normals = face_normals(self.vertices[start:end])
+            stored = self.normals[start:end]
+            normals[np.einsum("ij,ij->i", normals, stored) < 0] *= -1
+            self.normals[start:end] = normals
+
+    def merge_coplanar_faces(self):
+        """
+        Replaces axis aligned faces filling rectangles of one plane with the
+        fewest rectangles greedy meshing finds, eg. flat grid top becomes 2 faces
+        """
+        enabled = np.flatnonzero(~self.disabled)
+        replaced, vertices, normals = coplanar_rectangles(
+            self.vertices[enabled], self.normals[enabled]
+        )
+        self.disabled[enabled[replaced]] = True
+        self.append_faces(vertices, normals)
+
+    def wall_corners(self) -> NDArray:
+        """
+        (W,4,3) corners of every wall, rect stores them as p1,p4,p2 + p3
+        """
+        first, second = self.wall_faces.T
+        return np.concatenate(
+            (self.vertices[first], self.vertices[second][:, 2:]), axis=1
+        )
 
     def prune_duplicate_walls(self):
-        for j in range(len(self.walls)):
-            for k in range(j + 1, len(self.walls)):
-                if self.walls[j].get_point_set() == self.walls[k].get_point_set():
-                    self.walls[k].disable()
-                    self.walls[j].disable()
+        """
+        Disables repeated walls, all of a group when they face opposite ways
+        """
+        duplicated = duplicate_walls(
+            self.wall_corners(), self.normals[self.wall_faces[:, 0]]
+        )
+        self.disabled[self.wall_faces[duplicated].ravel()] = True
+
+    def remove_hidden_walls(self):
+        """
+        Disables walls touching an opposite facing wall in the same plane and
+        adds back, as new walls, the parts of them that stay visible
+        """
+        enabled = np.flatnonzero(~self.disabled[self.wall_faces].any(axis=1))
+        hidden, faces, normals = hidden_walls(
+            self.wall_corners()[enabled], self.normals[self.wall_faces[enabled, 0]]
+        )
+        self.disabled[self.wall_faces[enabled[hidden]].ravel()] = True
+
+        start = self.append_faces(faces, np.repeat(normals, 2, axis=0))
+        self.append_walls(start + np.arange(2 * len(faces)).reshape(-1, 2))
 
     def prune_duplicate_faces(self):
-        for j in range(len(self.faces)):
-            for k in range(j + 1, len(self.faces)):
-                face1 = self.faces[j]
-                face2 = self.faces[k]
-                if face1.get_point_set() == face2.get_point_set():
-                    if face1.normal != face2.normal:
-                        face1.disabled = True
-                        face2.disabled = True
-                    else:
-                        face2.disabled = True
+        """
+        Disables repeated faces, both of an opposite facing pair
+        """
+        enabled = np.flatnonzero(~self.disabled)
+        duplicated = duplicate_faces(
+            self.vertices[enabled], self.normals[enabled]
+        )
+        self.disabled[enabled[duplicated]] = True
 
+    @cached_primitive
     def box(self, x: float, y: float, z: float, side: float) -> State:
         return self.cuboid(x, y, z, side, side, side)
 
+    @cached_primitive
     def cuboid(
         self,
         x: float,
@@ -158,6 +644,74 @@ class State:
             raise Exception(
                 "Gap on one axis needs to be None (so that gap leads outside)"
             )
+        template = self.templates.get(
+            ("cuboid", w_x, w_y, w_z, g_x, g_y, g_z),
+            lambda: Template(
+                State(dtype=np.float64)._cuboid_geometry(
+                    0, 0, 0, w_x, w_y, w_z, g_x, g_y, g_z
+                )
+            ),
+        )
+        return self.place(template, x, y, z)
+
+    @cached_primitive
+    def boxes(self, boxes: ArrayLike) -> State:
+        """
+        Creates M boxes from (M,4) rows of x, y, z, side
+        """
+        boxes = np.asarray(boxes, np.float64).reshape(-1, 4)
+        return self.cuboids(np.concatenate((boxes, boxes[:, [3, 3]]), axis=1))
+
+    @cached_primitive
+    def cuboids(self, cuboids: ArrayLike, gaps: ArrayLike | None = None) -> State:
+        """
+        Creates M cuboids from (M,6) rows of x, y, z, w_x, w_y, w_z in one
+        vectorized pass, gaps are (M,3) rows of g_x, g_y, g_z with nan for None
+        Faces come grouped by gap axes, not in row order
+        """
+        cuboids = np.asarray(cuboids, np.float64).reshape(-1, 6)
+        if gaps is None:
+            gaps = np.full((len(cuboids), 3), np.nan)
+        gaps = np.asarray(gaps, np.float64).reshape(-1, 3)
+        has_gap = ~np.isnan(gaps)
+        if has_gap.all(axis=1).any():
+            raise Exception(
+                "Gap on one axis needs to be None (so that gap leads outside)"
+            )
+        gaps = np.nan_to_num(gaps)
+
+        patterns, pattern_rows = np.unique(has_gap, axis=0, return_inverse=True)
+        for pattern, gap_axes in enumerate(patterns):
+            template, coefficients = cuboid_basis(tuple(map(bool, gap_axes)))
+            rows = np.flatnonzero(pattern_rows.ravel() == pattern)
+            for start in range(0, len(rows), CUBOID_BATCH_SIZE):
+                batch = rows[start : start + CUBOID_BATCH_SIZE]
+                vertices = (
+                    cuboids[batch, None, None, :3]
+                    + cuboids[batch, None, None, 3:] * template.vertices
+                    + gaps[batch, None, None] * coefficients
+                )
+                first = self.append_faces(
+                    vertices, np.tile(template.normals, (len(batch), 1))
+                )
+                faces = len(template.vertices)
+                self.append_walls(
+                    first + faces * np.arange(len(batch))[:, None, None] + template.walls
+                )
+        return self
+
+    def _cuboid_geometry(
+        self,
+        x: float,
+        y: float,
+        z: float,
+        w_x: float,
+        w_y: float,
+        w_z: float,
+        g_x: float | None,
+        g_y: float | None,
+        g_z: float | None,
+    ) -> State:
         if not (g_x is not None and g_z is not None):
             self.rect(x, y, z, x + w_x, y, z + w_z, x, y, z + w_z, *FRONT, True)
             self.rect(
@@ -342,14 +896,10 @@ class State:
         ny: float,
         nz: float,
     ) -> State:
-        p1 = Point(x, y, z)
-        p2 = Point(x2, y2, z2)
-        p3 = Point(x3, y3, z3)
-        face = Face([p1, p2, p3], normal=Point(nx, ny, nz))
-
-        self.faces.append(face)
+        self.append_faces((x, y, z, x2, y2, z2, x3, y3, z3), (nx, ny, nz))
         return self
 
+    @cached_primitive
     def prism(
         self,
         x1: float,
@@ -368,7 +918,40 @@ class State:
         """
         Creates prism using first 3 points as base and 4th as its peak (up or down)
         """
+        relative = (
+            x2 - x1,
+            y2 - y1,
+            z2 - z1,
+            x3 - x1,
+            y3 - y1,
+            z3 - z1,
+            x4 - x1,
+            y4 - y1,
+            z4 - z1,
+        )
+        template = self.templates.get(
+            ("prism", *relative),
+            lambda: Template(
+                State(dtype=np.float64)._prism_geometry(0, 0, 0, *relative)
+            ),
+        )
+        return self.place(template, x1, y1, z1)
 
+    def _prism_geometry(
+        self,
+        x1: float,
+        y1: float,
+        z1: float,
+        x2: float,
+        y2: float,
+        z2: float,
+        x3: float,
+        y3: float,
+        z3: float,
+        x4: float,
+        y4: float,
+        z4: float,
+    ) -> State:
         UPSIDE_DOWN = True if (z3 < z1) else False
 
         BASE_NORMAL = BOTTOM if not UPSIDE_DOWN else TOP
@@ -379,75 +962,127 @@ class State:
         p2 = (x2, y2, z2)
         p3 = (x3, y3, z3)
         p4 = (x4, y4, z4)
-        for first, second, third in [
-            (p1, p2, p4),
-            (p2, p3, p4),
-            (p3, p1, p4),
-        ]:
-            vectA = (second[0] - first[0], second[1] - first[1], second[2] - first[2])
-            vectB = (third[0] - first[0], third[1] - first[1], third[2] - first[2])
-            self.triangle(*first, *second, *third, *np.cross(vectA, vectB))
+        sides = np.array([(p1, p2, p4), (p2, p3, p4), (p3, p1, p4)], np.float64)
+        self.append_faces(sides, face_normals(sides))
 
         return self
 
+    @cached_primitive
     def grid(
-            self,
-            sections_x: int,
-            sections_y: int,
-            cell_size: float,
-            height: float
-            ) -> State:
-        # bottom 
-        self.rect(0,0,0,
-                  0, sections_y*cell_size, 0,
-                  sections_x*cell_size, 0, 0,
-                  0, 0, -1
-                  )
-
-        # left 
-        self.rect(0,0,0,
-                  0, sections_y*cell_size, height,
-                  0, sections_y*cell_size, 0,
-                  0, 0, -1
-                  )
-
-        # right 
-        self.rect(sections_x*cell_size,0,0,
-                  sections_x*cell_size, sections_y*cell_size, height,
-                  sections_x*cell_size, sections_y*cell_size, 0,
-                  0, 0, -1
-                  )
-        # front 
-        self.rect(0,0,0,
-                  sections_x*cell_size, 0, height,
-                  0, 0, height,
-                  0, 0, -1
-                  )
-        # back 
-        self.rect(0,sections_y*cell_size,0,
-                  sections_x*cell_size, sections_y*cell_size, height,
-                  0, sections_y*cell_size, height,
-                  0, 0, -1
-                  )
-        for i in range(sections_x):
-            print(i)
-            for j in range(sections_y):
-                # top
-                self.rect(
-                        i*cell_size,
-                        j*cell_size,
-                        height,
-
-                        i*cell_size + cell_size,
-                        j*cell_size,
-                        height,
-
-                        i*cell_size,
-                        j*cell_size + cell_size,
-                        height,
-
-                        0, 0, 1
-                        )
+        self,
+        sections_x: int,
+        sections_y: int,
+        cell_size: float,
+        height: float,
+        progress: Callable[[int, int], None] | None = None,
+    ) -> State:
+        """
+        Creates sections_x * sections_y flat cells on top of a box of given height,
+        top cells are generated by blocks of rows, progress(rows_done, sections_x)
+        is called after each block
+        """
+        size_x = sections_x * cell_size
+        size_y = sections_y * cell_size
+
+        self.rect(0, 0, 0, size_x, size_y, 0, size_x, 0, 0, *BOTTOM)
+        self.rect(0, 0, 0, 0, size_y, height, 0, size_y, 0, *LEFT)
+        self.rect(size_x, 0, 0, size_x, size_y, height, size_x, 0, height, *RIGHT)
+        self.rect(0, 0, 0, size_x, 0, height, 0, 0, height, *FRONT)
+        self.rect(0, size_y, 0, size_x, size_y, height, size_x, size_y, 0, *BACK)
+
+        rows_per_block = max(1, GRID_BLOCK_CELLS // max(sections_y, 1))
+        ys = np.arange(sections_y) * cell_size
+        for row in range(0, sections_x, rows_per_block):
+            xs = np.arange(row, min(row + rows_per_block, sections_x)) * cell_size
+            x, y = np.meshgrid(xs, ys, indexing="ij")
+            x, y = x.ravel(), y.ravel()
+            z = np.full_like(x, height)
+
+            a = np.stack((x, y, z), axis=-1)
+            b = np.stack((x + cell_size, y, z), axis=-1)
+            c = np.stack((x + cell_size, y + cell_size, z), axis=-1)
+            d = np.stack((x, y + cell_size, z), axis=-1)
+
+            # two triangles per cell, (a, b, c) and (a, c, d)
+            cells = np.stack((a, b, c, a, c, d), axis=1).reshape(-1, 3, 3)
+            self.append_faces(cells, TOP)
+
+            if progress is not None:
+                progress(row + len(xs), sections_x)
+        return self
+
+    @cached_primitive
+    def heightmap(
+        self,
+        heights: ArrayLike,
+        cell_size: float,
+        progress: Callable[[int, int], None] | None = None,
+    ) -> State:
+        """
+        Creates closed solid whose top surface passes through heights[i, j] at
+        (i * cell_size, j * cell_size), with side walls and flat bottom at z=0
+        Top faces are generated by blocks of rows like grid
+        """
+        heights = np.asarray(heights, np.float64)
+        rows, cols = heights.shape
+        if rows < 2 or cols < 2:
+            raise Exception("Heightmap needs at least 2x2 heights")
+
+        rows_per_block = max(1, GRID_BLOCK_CELLS // cols)
+        ys = np.arange(cols) * cell_size
+        for row in range(0, rows - 1, rows_per_block):
+            end = min(row + rows_per_block, rows - 1)
+            xs = np.arange(row, end + 1) * cell_size
+            x, y = np.meshgrid(xs, ys, indexing="ij")
+            points = np.stack((x, y, heights[row : end + 1]), axis=-1)
+
+            a = points[:-1, :-1].reshape(-1, 3)
+            b = points[1:, :-1].reshape(-1, 3)
+            c = points[1:, 1:].reshape(-1, 3)
+            d = points[:-1, 1:].reshape(-1, 3)
+
+            cells = np.stack((a, b, c, a, c, d), axis=1).reshape(-1, 3, 3)
+            self.append_faces(cells, face_normals(cells))
+
+            if progress is not None:
+                progress(end, rows - 1)
+
+        # boundary of the grid counter clockwise seen from above, as (i, j)
+        i = np.concatenate(
+            (
+                np.arange(rows - 1),
+                np.full(cols - 1, rows - 1),
+                np.arange(rows - 1, 0, -1),
+                np.zeros(cols - 1, np.int64),
+            )
+        )
+        j = np.concatenate(
+            (
+                np.zeros(rows - 1, np.int64),
+                np.arange(cols - 1),
+                np.full(rows - 1, cols - 1),
+                np.arange(cols - 1, 0, -1),
+            )
+        )
+        top = np.stack((i * cell_size, j * cell_size, heights[i, j]), axis=-1)
+        bottom = top.copy()
+        bottom[:, 2] = 0
+        top_next = np.roll(top, -1, axis=0)
+        bottom_next = np.roll(bottom, -1, axis=0)
+
+        side_normals = np.repeat(
+            [FRONT, RIGHT, BACK, LEFT], [rows - 1, cols - 1, rows - 1, cols - 1], axis=0
+        )
+        walls = np.stack(
+            (bottom, bottom_next, top_next, bottom, top_next, top), axis=1
+        ).reshape(-1, 3, 3)
+        self.append_faces(walls, np.repeat(side_normals, 2, axis=0))
+
+        center = np.array([(rows - 1) * cell_size / 2, (cols - 1) * cell_size / 2, 0])
+        fan = np.stack(
+            (np.broadcast_to(center, bottom.shape), bottom_next, bottom), axis=1
+        )
+        self.append_faces(fan, BOTTOM)
         return self
 
     def rect(
@@ -471,20 +1106,18 @@ class State:
         First 2 points must cross diagonally
         """
         mid_point = [(x + x2) / 2, (y + y2) / 2, (z + z2) / 2]
-        p1 = Point(x, y, z)
-        p2 = Point(x2, y2, z2)
-        p3 = Point(x3, y3, z3)
-        p4 = Point(
+        p1 = (x, y, z)
+        p2 = (x2, y2, z2)
+        p3 = (x3, y3, z3)
+        p4 = (
             mid_point[0] - (x3 - mid_point[0]),
             mid_point[1] - (y3 - mid_point[1]),
             mid_point[2] - (z3 - mid_point[2]),
         )
 
-        f1 = Face([p1, p4, p2], normal=Point(nx, ny, nz))
-        f2 = Face([p1, p2, p3], normal=Point(nx, ny, nz))
+        start = self.append_faces((p1, p4, p2, p1, p2, p3), (nx, ny, nz))
 
         if create_wall:
-            self.walls.append(Wall([f1, f2]))
-        self.faces += [f1, f2]
+            self.append_walls((start, start + 1))
 
         return self
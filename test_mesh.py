@@ -0,0 +1,93 @@
+import numpy as np
+
+from mesh import coplanar_rectangles, decimate, face_normals, hidden_walls, rect_faces
+from state import State
+
+
+def box_faces():
+    state = State()
+    state.box(0, 0, 0, 1)
+    state.prepare_export()
+    enabled = ~state.disabled
+    return state.vertices[enabled], state.normals[enabled]
+
+
+def test_decimate_within_budget_returns_input():
+    vertices, normals = box_faces()
+    assert decimate(vertices, normals, 12)[0] is vertices
+
+
+def test_decimate_never_empties_mesh():
+    vertices, normals = box_faces()
+    assert len(decimate(vertices, normals, 4)[0]) > 0
+
+
+def test_decimate_normals_follow_stored_normals():
+    x, y = np.meshgrid(np.linspace(0, 4, 21), np.linspace(0, 4, 21))
+    points = np.stack([x, y, np.sin(x) * np.cos(y)], axis=-1)
+    a, b, c, d = points[:-1, :-1], points[1:, :-1], points[1:, 1:], points[:-1, 1:]
+    vertices = np.concatenate(
+        (np.stack([a, b, c], 2).reshape(-1, 3, 3), np.stack([a, c, d], 2).reshape(-1, 3, 3))
+    )
+    normals = face_normals(vertices)
+    normals[normals[:, 2] < 0] *= -1
+    # winding flipped on every other triangle, stored normals all point up
+    vertices[::2] = vertices[::2, ::-1]
+    decimated, decimated_normals = decimate(vertices, normals, 200)
+    assert 0 < len(decimated) <= 200
+    assert (decimated_normals[:, 2] > 0).all()
+
+
+def covers(points, u0, u1, v0, v1):
+    """
+    Whether each (P,2) point lies inside any of the rectangles
+    """
+    u, v = points[:, :1], points[:, 1:]
+    return ((u0 < u) & (u < u1) & (v0 < v) & (v < v1)).any(axis=1)
+
+
+def test_hidden_walls_clip_scattered_walls():
+    rng = np.random.default_rng(0)
+    count = 60
+    u0, v0 = rng.uniform(0, 10, (2, count)).round(3)
+    u1 = u0 + rng.uniform(0.1, 4, count).round(3)
+    v1 = v0 + rng.uniform(0.1, 4, count).round(3)
+    z = rng.choice([0.0, 1.5], count)
+    side = rng.choice([-1, 1], count)
+    rectangle = ((u0, v0), (u1, v0), (u1, v1), (u0, v1))
+    corners = np.stack([np.stack([u, v, z], axis=1) for u, v in rectangle], axis=1)
+    normals = np.zeros((count, 3))
+    normals[:, 2] = side
+    hidden, faces, faces_normals = hidden_walls(corners, normals)
+    assert hidden.any()
+
+    points = rng.uniform(0, 14, (5000, 2))
+    low, high = faces.min(axis=(1, 2)), faces.max(axis=(1, 2))
+    for plane in (0.0, 1.5):
+        for facing in (-1, 1):
+            walls = (z == plane) & (side == facing)
+            opposite = (z == plane) & (side == -facing)
+            facing_walls = covers(points, u0[walls], u1[walls], v0[walls], v1[walls])
+            visible = facing_walls & ~covers(
+                points, u0[opposite], u1[opposite], v0[opposite], v1[opposite]
+            )
+            kept = walls & ~hidden
+            parts = (low[:, 2] == plane) & (faces_normals[:, 2] == facing)
+            drawn = covers(points, u0[kept], u1[kept], v0[kept], v1[kept]) | covers(
+                points, low[parts, 0], high[parts, 0], low[parts, 1], high[parts, 1]
+            )
+            assert (drawn == visible).all()
+
+
+def test_coplanar_rectangles_skips_scattered_planes():
+    # 8x8 tiles fill a square at z = 0, scattered squares lie at z = 1
+    u0, v0 = (value.ravel() for value in np.meshgrid(np.arange(8.0), np.arange(8.0)))
+    tiles = rect_faces(2, 1, 0.0, u0, u0 + 1, v0, v0 + 1)
+    u0, v0 = np.random.default_rng(0).uniform(0, 100, (2, 64)).round(3)
+    scattered = rect_faces(2, 1, 1.0, u0, u0 + 0.5, v0, v0 + 0.5)
+    vertices = np.concatenate((tiles, scattered))
+    normals = np.tile([0.0, 0.0, 1.0], (len(vertices), 1))
+    replaced, new_vertices, _ = coplanar_rectangles(vertices, normals)
+    assert replaced[: len(tiles)].all()
+    assert not replaced[len(tiles) :].any()
+    assert len(new_vertices) == 2
@@ -0,0 +1,73 @@
+import numpy as np
+
+import pyrender
+from state import State
+
+
+class RecordingGL:
+    """
+    Stand-in for OpenGL.GL and GLU, constants are distinct bits and calls are
+    recorded, buffer ids count up
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.constants = {}
+
+    def __getattr__(self, name: str):
+        if name.startswith("GL_"):
+            return self.constants.setdefault(name, 1 << len(self.constants))
+
+        def call(*args):
+            self.calls.append((name, args))
+            if name == "glGenBuffers":
+                return len(self.calls)
+
+        return call
+
+    def names(self):
+        return [name for name, _ in self.calls]
+
+
+def render_twice(source):
+    gl, glu = RecordingGL(), RecordingGL()
+    pyrender.gMesh = pyrender.gFrame = None
+    pyrender.load_arrays(source)
+    pyrender.setup_lighting(gl)
+    pyrender.render(gl, glu)
+    first = len(gl.calls)
+    pyrender.render(gl, glu)
+    return gl, first
+
+
+def test_geometry_uploaded_once():
+    state = State()
+    state.box(0, 0, 0, 1)
+    gl, first = render_twice(state)
+    # frame, vertices and normals on the first frame, nothing after
+    assert gl.names()[:first].count("glBufferData") == 3
+    assert "glBufferData" not in gl.names()[first:]
+    draws = [args for name, args in gl.calls[first:] if name == "glDrawArrays"]
+    assert draws == [(gl.GL_LINES, 0, 6), (gl.GL_TRIANGLES, 0, 3 * 12)]
+
+
+def test_float64_arrays_draw_as_double():
+    vertices = np.zeros((2, 3, 3))
+    normals = np.tile([0.0, 0.0, 1.0], (2, 1))
+    gl, _ = render_twice((vertices, normals))
+    pointers = [args[1] for name, args in gl.calls if name == "glVertexPointer"]
+    assert gl.GL_DOUBLE in pointers
+
+
+def test_prepared_state_draws_enabled_runs_without_copy():
+    state = State()
+    state.box(0, 0, 0, 1)
+    state.box(1, 0, 0, 1)
+    vertices, _ = state.enabled_faces()
+    gl, first = render_twice(state)
+    # buffers hold every face, the shared wall is skipped when drawing
+    sizes = [args[1] for name, args in gl.calls if name == "glBufferData"]
+    assert sizes[1] == state.vertices.nbytes
+    draws = [args for name, args in gl.calls[first:] if name == "glMultiDrawArrays"]
+    assert len(draws) == 1
+    assert draws[0][2].sum() == 3 * len(vertices)
@@ -0,0 +1,20 @@
+from state import State
+
+
+def enabled(state: State) -> int:
+    state.prepare_export()
+    return int((~state.disabled).sum())
+
+
+def test_identical_boxes_keep_one():
+    state = State()
+    state.box(0, 0, 0, 1)
+    state.box(0, 0, 0, 1)
+    assert enabled(state) == 12
+
+
+def test_touching_boxes_drop_shared_walls():
+    state = State()
+    state.box(0, 0, 0, 1)
+    state.box(1, 0, 0, 1)
+    assert enabled(state) == 20
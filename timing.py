@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator, List
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not on windows
+    resource = None
+
+if TYPE_CHECKING:
+    from state import State
+
+
+def peak_rss() -> int:
+    """
+    Peak resident set size of this process in bytes, 0 when unknown
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Stage:
+    name: str
+    depth: int
+    seconds: float
+    faces_before: int
+    faces_after: int
+    allocated_blocks: int
+    peak_rss: int
+
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth
+        self.seconds = 0.0
+        self.faces_before = 0
+        self.faces_after = 0
+        self.allocated_blocks = 0
+        self.peak_rss = 0
+
+
+class Profiler:
+    """
+    Records wall time, enabled face counts, python allocated blocks and peak
+    RSS of named pipeline stages, nested stages are indented in the table
+    """
+
+    stages: List[Stage]
+
+    def __init__(self):
+        self.stages = []
+        self._depth = 0
+
+    @contextmanager
+    def stage(self, name: str, state: State | None = None) -> Iterator[Stage]:
+        stage = Stage(name, self._depth)
+        self.stages.append(stage)
+        stage.faces_before = _enabled(state)
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            yield stage
+        finally:
+            self._depth -= 1
+            stage.seconds = time.perf_counter() - start
+            stage.allocated_blocks = sys.getallocatedblocks() - blocks
+            stage.faces_after = _enabled(state)
+            stage.peak_rss = peak_rss()
+
+    def record(self, name: str, seconds: float, faces: int = 0):
+        """
+        Adds stage measured elsewhere, eg. time summed over a loop
+        """
+        stage = Stage(name, self._depth)
+        stage.seconds = seconds
+        stage.faces_before = stage.faces_after = faces
+        stage.peak_rss = peak_rss()
+        self.stages.append(stage)
+
+    def table(self) -> str:
+        width = max([len(s.name) + 2 * s.depth for s in self.stages] + [5])
+        lines = [
+            f"{'stage':<{width}} {'seconds':>9} {'faces in':>10} {'faces out':>10} "
+            f"{'blocks':>9} {'peak RSS MB':>12}"
+        ]
+        for s in self.stages:
+            name = "  " * s.depth + s.name
+            lines.append(
+                f"{name:<{width}} {s.seconds:>9.4f} {s.faces_before:>10} "
+                f"{s.faces_after:>10} {s.allocated_blocks:>9} {s.peak_rss / 2**20:>12.1f}"
+            )
+        return "\n".join(lines)
+
+
+def _enabled(state: State | None) -> int:
+    if state is None:
+        return 0
+    return int(state.face_count - state.disabled.sum())